@@ -1,11 +1,50 @@
 const express = require('express');
 const { body, validationResult } = require('express-validator');
 const { spawn } = require('child_process');
+const net = require('net');
 const path = require('path');
 const fs = require('fs');
 
 const router = express.Router();
 
+// Unix socket of a running `voice_generator.py --serve` daemon. When set and
+// present, jobs go to its warm worker pool instead of a fresh python3 process.
+const VOICE_DAEMON_SOCKET = process.env.VOICE_DAEMON_SOCKET;
+// How long a render may run without an answer from the daemon
+const VOICE_DAEMON_TIMEOUT_MS = Number(process.env.VOICE_DAEMON_TIMEOUT_MS) || 10 * 60 * 1000;
+
+class VoiceDaemonTimeout extends Error {}
+
+// Send one render job to the voice daemon and resolve with its JSON response
+const submitToVoiceDaemon = (socketPath, job, timeout = VOICE_DAEMON_TIMEOUT_MS) => new Promise((resolve, reject) => {
+  const client = net.createConnection(socketPath);
+  let buffer = '';
+
+  client.setEncoding('utf8');
+  client.setTimeout(timeout, () => {
+    client.destroy();
+    reject(new VoiceDaemonTimeout(`Voice daemon did not answer within ${timeout} ms`));
+  });
+  client.on('connect', () => {
+    client.end(JSON.stringify(job) + '\n');
+  });
+  client.on('data', (data) => {
+    buffer += data;
+  });
+  client.on('end', () => {
+    const line = buffer.split('\n').find((entry) => entry.trim().length > 0);
+    if (!line) {
+      return reject(new Error('Voice daemon closed the connection without a response'));
+    }
+    try {
+      resolve(JSON.parse(line));
+    } catch (error) {
+      reject(error);
+    }
+  });
+  client.on('error', reject);
+});
+
 // @route   POST /api/voice-generation/generate-audio
 // @desc    Generate audio from text using Python script
 // @access  Public
@@ -47,42 +86,17 @@ router.post('/generate-audio', [
     // Write text to temporary file
     fs.writeFileSync(tempTextFile, text);
 
-    // Path to your Python script
-    const pythonScriptPath = path.join(__dirname, '../../voice_generator.py');
-
-    // Spawn Python process to generate audio with environment variables
-    const pythonProcess = spawn('python3', [
-      pythonScriptPath,
-      '--text-file', tempTextFile,
-      '--output', outputAudioFile,
-      '--voice-mode', voice_mode.toString(),
-      '--filename', filename
-    ], {
-      env: {
-        ...process.env,
-        DEEPGRAM_API_KEY: process.env.DEEPGRAM_API_KEY
-      }
-    });
-
-    let errorOutput = '';
-
-    pythonProcess.stderr.on('data', (data) => {
-      errorOutput += data.toString();
-      console.error('Python error:', data.toString());
-    });
-
-    pythonProcess.on('close', (code) => {
+    const finish = (errorMessage) => {
       // Clean up temporary text file
       if (fs.existsSync(tempTextFile)) {
         fs.unlinkSync(tempTextFile);
       }
 
-      if (code !== 0) {
-        console.error('Python process exited with code:', code);
+      if (errorMessage !== null) {
         return res.status(500).json({
           success: false,
           message: 'Failed to generate audio',
-          error: errorOutput
+          error: errorMessage
         });
       }
 
@@ -104,6 +118,57 @@ router.post('/generate-audio', [
           voice_mode: voice_mode
         }
       });
+    };
+
+    if (VOICE_DAEMON_SOCKET && fs.existsSync(VOICE_DAEMON_SOCKET)) {
+      try {
+        const response = await submitToVoiceDaemon(VOICE_DAEMON_SOCKET, {
+          text_file: tempTextFile,
+          output: outputAudioFile,
+          voice_mode: Number(voice_mode)
+        });
+        return finish(response.status === 'success' ? null : (response.message || 'Voice daemon failed'));
+      } catch (error) {
+        console.error('Voice daemon error:', error.message);
+        // A hung daemon may still be rendering into the output file, so
+        // do not start a second render next to it
+        if (error instanceof VoiceDaemonTimeout) {
+          return finish(error.message);
+        }
+        // Daemon unreachable: fall back to a one-off Python process below
+      }
+    }
+
+    // Path to your Python script
+    const pythonScriptPath = path.join(__dirname, '../../voice_generator.py');
+
+    // Spawn Python process to generate audio with environment variables
+    const pythonProcess = spawn('python3', [
+      pythonScriptPath,
+      '--text-file', tempTextFile,
+      '--output', outputAudioFile,
+      '--voice-mode', voice_mode.toString(),
+      '--filename', filename
+    ], {
+      env: {
+        ...process.env,
+        DEEPGRAM_API_KEY: process.env.DEEPGRAM_API_KEY
+      }
+    });
+
+    let errorOutput = '';
+
+    pythonProcess.stderr.on('data', (data) => {
+      errorOutput += data.toString();
+      console.error('Python error:', data.toString());
+    });
+
+    pythonProcess.on('close', (code) => {
+      if (code !== 0) {
+        console.error('Python process exited with code:', code);
+        return finish(errorOutput);
+      }
+      finish(null);
     });
 
   } catch (error) {
@@ -0,0 +1,119 @@
+"""
+Pooled, keep-alive client for the Deepgram text-to-speech REST API.
+
+One client is shared by the whole process (getDeepgramClient), so chunks
+reuse pooled HTTPS connections instead of paying a TLS handshake each.
+Every call has a timeout, and server errors and connection failures are
+retried with exponential backoff and full jitter. Throttling (429) is
+retried the same way only by clients created with retryThrottles; the
+shared client runs behind the TTS scheduler, which has to see every 429 to
+back its limits off, so it raises DeepgramThrottled on the first one.
+Retry-After is honoured up to DEEPGRAM_MAX_RETRY_AFTER seconds.
+The base URL is configurable, so tests and benchmarks can point the
+client at a local stand-in server.
+"""
+
+import os
+import random
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = os.getenv('DEEPGRAM_BASE_URL', 'https://api.deepgram.com')
+DEFAULT_POOL_SIZE = int(os.getenv('DEEPGRAM_POOL_SIZE', '16'))
+DEFAULT_TIMEOUT = float(os.getenv('DEEPGRAM_TIMEOUT', '60'))
+DEFAULT_RETRIES = int(os.getenv('DEEPGRAM_RETRIES', '3'))
+MAX_RETRY_AFTER = float(os.getenv('DEEPGRAM_MAX_RETRY_AFTER', '30'))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class DeepgramError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class DeepgramThrottled(DeepgramError):
+    """The API answered 429 (on every attempt, when throttles are retried)."""
+
+class DeepgramSpeakClient:
+    def __init__(self, apiKey, baseUrl=DEFAULT_BASE_URL, poolSize=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT, connectTimeout=5.0, retries=DEFAULT_RETRIES, backoff=0.5,
+                 retryThrottles=True, maxRetryAfter=MAX_RETRY_AFTER):
+        self.baseUrl = baseUrl.rstrip('/')
+        self.timeout = timeout
+        self.connectTimeout = connectTimeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retryThrottles = retryThrottles
+        self.maxRetryAfter = maxRetryAfter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Token {apiKey}',
+            'Content-Type': 'application/json',
+        })
+
+    def _delay(self, attempt, response=None):
+        # Honour Retry-After (capped) when the server sends one, otherwise full jitter
+        if response is not None and response.headers.get('Retry-After'):
+            try:
+                return min(max(float(response.headers['Retry-After']), 0.0), self.maxRetryAfter)
+            except ValueError:
+                pass
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def speak(self, text, model, destination, timeout=None):
+        """Synthesize text with the given voice model into the destination MP3."""
+        url = f'{self.baseUrl}/v1/speak'
+        params = {'model': model, 'encoding': 'mp3'}
+        lastError = None
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                response = self.session.post(url, params=params, json={'text': text},
+                                             timeout=(self.connectTimeout, timeout or self.timeout))
+                if response.status_code == 200:
+                    self._save(response.content, destination)
+                    return destination
+                message = f'Deepgram returned {response.status_code}: {response.text[:200]}'
+                if response.status_code == 429 and not self.retryThrottles:
+                    raise DeepgramThrottled(message, response.status_code)
+                if response.status_code not in RETRY_STATUSES:
+                    raise DeepgramError(message, response.status_code)
+                lastError = (DeepgramThrottled if response.status_code == 429 else DeepgramError)(message, response.status_code)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                lastError = DeepgramError(f'Deepgram request failed: {e}')
+            if attempt < self.retries:
+                time.sleep(self._delay(attempt, response))
+        raise lastError
+
+    def _save(self, data, destination):
+        directory = os.path.dirname(os.path.abspath(destination))
+        fd, tmpPath = tempfile.mkstemp(dir=directory, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmpPath, destination)
+
+    def close(self):
+        self.session.close()
+
+_client = None
+_clientLock = threading.Lock()
+
+def getDeepgramClient():
+    """The process-wide client, created on first use from the environment."""
+    global _client
+    with _clientLock:
+        if _client is None:
+            apiKey = os.getenv('DEEPGRAM_API_KEY')
+            if not apiKey:
+                raise ValueError("DEEPGRAM_API_KEY not found in environment variables")
+            # Throttles go straight to the scheduler in voice_generator.speakWith
+            _client = DeepgramSpeakClient(apiKey, os.getenv('DEEPGRAM_BASE_URL', DEFAULT_BASE_URL), retryThrottles=False)
+        return _client
@@ -0,0 +1,133 @@
+"""
+Low-bitrate HLS packaging of rendered episodes.
+
+Bedtime speech is mono, narrow-band and slow, so it stays intelligible at a
+fraction of the master MP3's bitrate. package() turns an episode into
+segmented HLS: one fMP4 rendition per entry of HLS_RENDITIONS (AAC at 32
+and Opus at 16 kbit/s by default) under <outDir>/<name>/, and a master.m3u8
+listing them with their codecs and measured bandwidth, so players can start
+on the first segment instead of downloading the whole file.
+
+Every rendition comes out of a single ffmpeg run. The stream engine goes a
+step further and adds outputArgs() to the encoder that writes the master
+MP3, so the episode is decoded once for all of its formats.
+"""
+
+import os
+import shutil
+import subprocess
+
+# Speech tuning for Opus, and constrained VBR so segments stay near the
+# advertised bitrate
+OPUS_OPTIONS = {'application': 'voip', 'vbr': 'constrained'}
+
+# name -> encoder settings; all renditions are mono
+RENDITIONS = {
+    'aac32': {'encoder': 'aac', 'bitrate': 32000, 'sampleRate': 24000, 'codecs': 'mp4a.40.2', 'options': {}},
+    'aac48': {'encoder': 'aac', 'bitrate': 48000, 'sampleRate': 24000, 'codecs': 'mp4a.40.2', 'options': {}},
+    'opus16': {'encoder': 'libopus', 'bitrate': 16000, 'sampleRate': 24000, 'codecs': 'opus', 'options': OPUS_OPTIONS},
+    'opus24': {'encoder': 'libopus', 'bitrate': 24000, 'sampleRate': 24000, 'codecs': 'opus', 'options': OPUS_OPTIONS},
+}
+# AAC first: players without Opus support start on the first rendition
+HLS_RENDITIONS = os.getenv('NAPCAST_HLS_RENDITIONS', 'aac32,opus16').split(',')
+HLS_SEGMENT_SECONDS = int(os.getenv('NAPCAST_HLS_SEGMENT_SECONDS', '10'))
+MASTER_PLAYLIST = 'master.m3u8'
+
+def renditionSpecs(renditions=None):
+    names = [name.strip() for name in (renditions or HLS_RENDITIONS) if name.strip()]
+    unknown = [name for name in names if name not in RENDITIONS]
+    if unknown or not names:
+        raise ValueError(f"Unknown HLS renditions: {', '.join(unknown) or 'none given'}")
+    return [(name, RENDITIONS[name]) for name in names]
+
+def outputArgs(outDir, renditions=None, segmentSeconds=HLS_SEGMENT_SECONDS):
+    """ffmpeg output options writing every rendition of input 0's audio"""
+    specs = renditionSpecs(renditions)
+    args = []
+    for _ in specs:
+        args += ['-map', '0:a']
+    for index, (_, spec) in enumerate(specs):
+        args += [f'-c:a:{index}', spec['encoder'], f'-b:a:{index}', str(spec['bitrate']), f'-ar:a:{index}', str(spec['sampleRate'])]
+        for option, value in spec['options'].items():
+            args += [f'-{option}:a:{index}', value]
+    args += [
+        '-ac', '1',
+        '-f', 'hls',
+        '-hls_time', str(segmentSeconds),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4',
+        '-hls_fmp4_init_filename', 'init.mp4',
+        '-hls_segment_filename', os.path.join(outDir, '%v', 'segment%05d.m4s'),
+        '-var_stream_map', ' '.join(f'a:{index},name:{name}' for index, (name, _) in enumerate(specs)),
+        os.path.join(outDir, '%v', 'index.m3u8'),
+    ]
+    return args
+
+def _segments(playlist):
+    # (duration, file) for each media segment of a rendition playlist
+    segments = []
+    duration = None
+    with open(playlist, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            elif line and not line.startswith('#') and duration is not None:
+                segments.append((duration, line))
+                duration = None
+    return segments
+
+def writeMasterPlaylist(outDir, renditions=None):
+    """Write master.m3u8 for the renditions in outDir and summarize them.
+
+    BANDWIDTH is the peak bitrate of any one segment and AVERAGE-BANDWIDTH
+    the bitrate over the whole episode, both measured from the files.
+    """
+    lines = ['#EXTM3U', '#EXT-X-VERSION:7', '#EXT-X-INDEPENDENT-SEGMENTS']
+    summary = []
+    for name, spec in renditionSpecs(renditions):
+        directory = os.path.join(outDir, name)
+        segments = _segments(os.path.join(directory, 'index.m3u8'))
+        if not segments:
+            raise RuntimeError(f"HLS rendition {name} has no segments")
+        sizes = [os.path.getsize(os.path.join(directory, file)) for _, file in segments]
+        seconds = sum(duration for duration, _ in segments)
+        peak = max(size * 8 / max(duration, 0.001) for (duration, _), size in zip(segments, sizes))
+        totalBytes = sum(os.path.getsize(os.path.join(directory, file)) for file in os.listdir(directory))
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={int(peak)},AVERAGE-BANDWIDTH={int(sum(sizes) * 8 / seconds)},CODECS="{spec["codecs"]}"')
+        lines.append(f'{name}/index.m3u8')
+        summary.append({
+            'name': name,
+            'codecs': spec['codecs'],
+            'bitrate': spec['bitrate'],
+            'segments': len(segments),
+            'seconds': round(seconds, 2),
+            'bytes': totalBytes,
+        })
+    with open(os.path.join(outDir, MASTER_PLAYLIST), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    return {
+        'playlist': MASTER_PLAYLIST,
+        'renditions': summary,
+        'bytes': sum(rendition['bytes'] for rendition in summary),
+    }
+
+def package(source, outDir, renditions=None, segmentSeconds=HLS_SEGMENT_SECONDS):
+    """Package an audio file as HLS into outDir with one ffmpeg run"""
+    from pydub.utils import get_encoder_name
+
+    os.makedirs(outDir, exist_ok=True)
+    result = subprocess.run(
+        [get_encoder_name(), '-v', 'error', '-y', '-i', source] + outputArgs(outDir, renditions, segmentSeconds),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not package {source} as HLS: {result.stderr.decode(errors='replace').strip()}")
+    return writeMasterPlaylist(outDir, renditions)
+
+def publish(source, destination):
+    # Replace destination with the finished package directory
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    if os.path.isdir(destination):
+        shutil.rmtree(destination)
+    shutil.move(source, destination)
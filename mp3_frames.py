@@ -0,0 +1,186 @@
+"""
+Frame-level MP3 concatenation.
+
+MPEG audio is a sequence of self-contained frames, so chunk files that were
+encoded with the same version, layer, sample rate and channel count can be
+joined by copying their frames one after the other. Per-file metadata is
+dropped on the way (ID3v2 and ID3v1 tags, and the Xing/Info/VBRI header
+frame the encoder wrote for that file alone) and a single Xing/Info header
+with the frame count, byte count and seek table of the joined stream is
+written in front. No audio is decoded or re-encoded.
+"""
+
+import struct
+
+# Layer III bitrates in kbit/s by bitrate index
+BITRATES = {
+    'mpeg1': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    'mpeg2': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+MONO = 3
+XING_FLAGS = 0x0007  # frame count, byte count and seek table
+
+class Mp3FrameError(ValueError):
+    """The files cannot be joined at the frame level."""
+
+class FrameHeader:
+    def __init__(self, data):
+        b0, b1, b2, b3 = data[0], data[1], data[2], data[3]
+        if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+            raise Mp3FrameError("lost frame sync")
+        self.version = (b1 >> 3) & 3
+        self.layer = (b1 >> 1) & 3
+        self.bitrateIndex = b2 >> 4
+        self.sampleRateIndex = (b2 >> 2) & 3
+        self.padding = (b2 >> 1) & 1
+        self.mode = b3 >> 6
+        if self.version == 1 or self.layer != 1:
+            raise Mp3FrameError("not an MPEG layer III frame")
+        if self.bitrateIndex in (0, 15) or self.sampleRateIndex == 3:
+            raise Mp3FrameError("unsupported bitrate or sample rate")
+        self.mpeg1 = self.version == 3
+        self.bitrate = BITRATES['mpeg1' if self.mpeg1 else 'mpeg2'][self.bitrateIndex] * 1000
+        self.sampleRate = SAMPLE_RATES[self.version][self.sampleRateIndex]
+        self.length = frameLength(self.mpeg1, self.bitrate, self.sampleRate, self.padding)
+
+    @property
+    def samples(self):
+        return 1152 if self.mpeg1 else 576
+
+    @property
+    def sideInfo(self):
+        if self.mpeg1:
+            return 17 if self.mode == MONO else 32
+        return 9 if self.mode == MONO else 17
+
+    def format(self):
+        # What has to match for two files' frames to be played as one stream
+        return (self.version, self.sampleRateIndex, self.mode == MONO)
+
+def frameLength(mpeg1, bitrate, sampleRate, padding=0):
+    return (144 if mpeg1 else 72) * bitrate // sampleRate + padding
+
+def _id3v2Size(data, offset):
+    if data[offset:offset + 3] != b'ID3' or len(data) < offset + 10:
+        return 0
+    size = 0
+    for byte in data[offset + 6:offset + 10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[offset + 5] & 0x10 else 0
+    return 10 + size + footer
+
+def _isInfoFrame(data, offset, header):
+    tagAt = offset + 4 + header.sideInfo
+    return data[tagAt:tagAt + 4] in (b'Xing', b'Info') or data[offset + 36:offset + 40] == b'VBRI'
+
+def scan(path):
+    """Locate the audio frames of one file.
+
+    Returns (start, end, frames, firstHeader, bitrates), where start:end is
+    the byte range holding the audio frames without tags or header frame.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    offset = 0
+    while True:
+        size = _id3v2Size(data, offset)
+        if not size:
+            break
+        offset += size
+    end = len(data)
+    if end - offset >= 128 and data[end - 128:end - 125] == b'TAG':
+        end -= 128
+
+    first = None
+    start = offset
+    frames = 0
+    bitrates = set()
+    while end - offset >= 4:
+        header = FrameHeader(data[offset:offset + 4])
+        if offset + header.length > end:
+            break  # truncated last frame
+        if first is None:
+            first = header
+            if _isInfoFrame(data, offset, header):
+                offset += header.length
+                start = offset
+                continue
+        elif header.format() != first.format():
+            raise Mp3FrameError(f"{path} changes format mid-stream")
+        frames += 1
+        bitrates.add(header.bitrate)
+        offset += header.length
+
+    if first is None or frames == 0:
+        raise Mp3FrameError(f"{path} holds no MP3 frames")
+    return start, offset, frames, first, bitrates
+
+def infoFrame(header, frames, totalBytes, toc, cbr):
+    """Build a Xing (VBR) or Info (CBR) header frame for the joined stream."""
+    payload = (b'Info' if cbr else b'Xing') + struct.pack('>III', XING_FLAGS, frames, totalBytes) + bytes(toc)
+    needed = 4 + header.sideInfo + len(payload)
+    bitrates = BITRATES['mpeg1' if header.mpeg1 else 'mpeg2']
+    # Same bitrate as the audio if the tag fits, otherwise the smallest that does
+    candidates = [header.bitrateIndex] + list(range(1, 15))
+    index = next(i for i in candidates if frameLength(header.mpeg1, bitrates[i] * 1000, header.sampleRate) >= needed)
+    length = frameLength(header.mpeg1, bitrates[index] * 1000, header.sampleRate)
+
+    b1 = 0xE0 | (header.version << 3) | (1 << 1) | 1  # layer III, no CRC
+    b2 = (index << 4) | (header.sampleRateIndex << 2)
+    b3 = header.mode << 6
+    frame = bytes([0xFF, b1, b2, b3]) + bytes(header.sideInfo) + payload
+    return frame + bytes(length - len(frame))
+
+def concatenate(files, output):
+    """Join MP3 files frame by frame into output.
+
+    Raises Mp3FrameError, before anything is written, if a file is not
+    plain MPEG layer III or the files do not share a sample rate, MPEG
+    version and channel count.
+    """
+    spans = [scan(path) for path in files]
+    first = spans[0][3]
+    for path, (_, _, _, header, _) in zip(files, spans):
+        if header.format() != first.format():
+            raise Mp3FrameError(f"{path} was encoded with different parameters")
+
+    frames = sum(span[2] for span in spans)
+    audioBytes = sum(span[1] - span[0] for span in spans)
+    cbr = len(set().union(*(span[4] for span in spans))) == 1
+    headerLength = len(infoFrame(first, frames, 0, [0] * 100, cbr))
+    totalBytes = headerLength + audioBytes
+
+    # Seek table: file position at each percent of the duration, in 1/256ths.
+    # Positions inside a chunk are interpolated, which is as precise as the
+    # table's resolution allows for chunks of a few minutes.
+    toc = []
+    frameStart = 0
+    byteStart = headerLength
+    for start, end, count, _, _ in spans:
+        while len(toc) < 100 and len(toc) * frames / 100 < frameStart + count:
+            within = (len(toc) * frames / 100 - frameStart) / count
+            position = byteStart + within * (end - start)
+            toc.append(min(255, int(position * 256 / totalBytes)))
+        frameStart += count
+        byteStart += end - start
+
+    with open(output, 'wb') as out:
+        out.write(infoFrame(first, frames, totalBytes, toc, cbr))
+        for path, (start, end, _, _, _) in zip(files, spans):
+            with open(path, 'rb') as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining:
+                    block = f.read(min(remaining, 1024 * 1024))
+                    if not block:
+                        raise Mp3FrameError(f"{path} changed while it was being joined")
+                    out.write(block)
+                    remaining -= len(block)
+    return {'frames': frames, 'bytes': totalBytes, 'seconds': frames * first.samples / first.sampleRate}
+
+def duration(path):
+    """Playing time of an MP3 file in seconds, counted from its frames."""
+    _, _, frames, header, _ = scan(path)
+    return frames * header.samples / header.sampleRate
@@ -12,6 +12,7 @@ from routes.rss_feeds import rss_feeds_bp
 from routes.analytics import analytics_bp
 from routes.content_templates import content_templates_bp
 from routes.system_config import system_config_bp
+from services import prerender_scheduler
 from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 from peft import PeftModel
 import torch
@@ -32,6 +33,10 @@ db = client['podcastDB']
 def before_request():
     request.db = db
 
+# Off-peak pre-rendering runs in the background; 0 minutes turns it off
+if prerender_scheduler.PRERENDER_INTERVAL_SECONDS > 0:
+    prerender_scheduler.ensure_runner(db)
+
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/users')
 app.register_blueprint(user_prompts_bp, url_prefix='/api/user-prompts')
@@ -64,11 +64,89 @@ class PodcastEpisode:
     def update_episode(self, episode_id, update_data):
         """Update episode"""
         update_data['updatedAt'] = datetime.utcnow()
+        # Rendered audio no longer matches an edited script
+        if any(key == 'script' or key.startswith('script.') for key in update_data):
+            update_data['audio.stale'] = True
         return self.collection.update_one(
             {'_id': ObjectId(episode_id)},
             {'$set': update_data}
         )
     
+    def get_script_text(self, episode):
+        """Narration text for an episode's script"""
+        script = episode.get('script') or {}
+        if isinstance(script, str):
+            return script
+        if script.get('content'):
+            return script['content']
+        return '\n\n'.join(segment.get('content', '') for segment in script.get('segments', []))
+    
+    def get_script_segments(self, episode):
+        """Script segments that have narration, in timeline order"""
+        script = episode.get('script') or {}
+        if isinstance(script, str):
+            return [{'type': 'main', 'content': script, 'timestamp': 0}]
+        segments = [segment for segment in script.get('segments', []) if (segment.get('content') or '').strip()]
+        return sorted(segments, key=lambda segment: segment.get('timestamp') or 0)
+    
+    def is_multi_voice(self, episode):
+        """Whether the script's segments need to be rendered separately"""
+        segments = self.get_script_segments(episode)
+        return len(segments) > 1 or any('voiceMode' in segment or 'rate' in segment for segment in segments)
+    
+    def save_audio_render(self, episode_id, file_path, voice_mode, chunk_plan, lazy=False, segments=None, hls=None):
+        """Record the rendered audio and the chunk plan used for it"""
+        audio = {
+            'filePath': file_path,
+            'voiceMode': voice_mode,
+            'chunkPlan': chunk_plan,
+            'lazy': lazy,
+            'generatedAt': datetime.utcnow(),
+            'stale': False
+        }
+        if segments is not None:
+            audio['segments'] = segments
+        if hls is not None:
+            audio['hls'] = hls
+        return self.collection.update_one(
+            {'_id': ObjectId(episode_id)},
+            {'$set': {
+                'audio': audio,
+                'updatedAt': datetime.utcnow()
+            }}
+        )
+    
+    def mark_prerendered(self, episode_id, predicted_session, seconds):
+        """Flag audio rendered ahead of a predicted listening session"""
+        return self.collection.update_one(
+            {'_id': ObjectId(episode_id)},
+            {'$set': {
+                'audio.prerendered': True,
+                'audio.predictedSession': predicted_session,
+                'audio.seconds': seconds
+            }}
+        )
+    
+    def mark_audio_evicted(self, episode_id):
+        """Flag audio removed from the audio store for re-rendering"""
+        return self.collection.update_one(
+            {'_id': ObjectId(episode_id)},
+            {'$set': {
+                'audio.filePath': None,
+                'audio.stale': True
+            }}
+        )
+    
+    def update_chunk_plan(self, episode_id, chunk_plan):
+        """Replace the chunk plan of a lazily rendered episode"""
+        return self.collection.update_one(
+            {'_id': ObjectId(episode_id)},
+            {'$set': {
+                'audio.chunkPlan': chunk_plan,
+                'audio.stale': False
+            }}
+        )
+    
     def delete_episode(self, episode_id):
         """Delete episode"""
         return self.collection.delete_one({'_id': ObjectId(episode_id)})
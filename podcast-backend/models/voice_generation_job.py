@@ -85,6 +85,16 @@ class VoiceGenerationJob:
             }}
         )
     
+    def attach_profile(self, job_id, profile):
+        """Attach a render profile report to a job"""
+        return self.collection.update_one(
+            {'_id': ObjectId(job_id)},
+            {'$set': {
+                'profile': profile,
+                'updatedAt': datetime.utcnow()
+            }}
+        )
+    
     def increment_retry_count(self, job_id):
         """Increment retry count"""
         return self.collection.update_one(
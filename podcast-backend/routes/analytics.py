@@ -1,10 +1,19 @@
 from flask import Blueprint, request, jsonify
 from models.analytics import Analytics
+from services import lazy_synthesis
 from datetime import datetime, timedelta
 from bson import ObjectId
 
 analytics_bp = Blueprint('analytics', __name__)
 
+def queue_render_ahead(data):
+    """Render lazy episodes ahead of playback-progress events"""
+    if data.get('type') != lazy_synthesis.PLAYBACK_PROGRESS or not data.get('episodeId'):
+        return
+    position = lazy_synthesis.playback_position(data)
+    if position is not None:
+        lazy_synthesis.on_playback_progress(request.db, data['episodeId'], position)
+
 @analytics_bp.route('/', methods=['POST'])
 def create_analytics_record():
     """Create a new analytics record"""
@@ -19,6 +28,7 @@ def create_analytics_record():
         
         analytics_model = Analytics(request.db)
         analytics_id = analytics_model.create_analytics_record(data)
+        queue_render_ahead(data)
         
         return jsonify({
             'message': 'Analytics record created successfully',
@@ -217,6 +227,7 @@ def track_interaction():
         analytics_id = analytics_model.track_interaction(
             user_id, interaction_type, episode_id, metadata
         )
+        queue_render_ahead(data)
         
         return jsonify({
             'message': 'Interaction tracked successfully',
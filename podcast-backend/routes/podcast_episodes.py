@@ -1,7 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_from_directory
 from models.podcast_episode import PodcastEpisode
+from services import audio_delivery, audio_store, episode_render, lazy_synthesis
 from datetime import datetime
 from bson import ObjectId
+from werkzeug.exceptions import NotFound
+import os
+from voice_generator import chunkReady
 
 podcast_episodes_bp = Blueprint('podcast_episodes', __name__)
 
@@ -121,6 +125,165 @@ def update_episode(episode_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@podcast_episodes_bp.route('/<episode_id>/render-audio', methods=['POST'])
+def render_episode_audio(episode_id):
+    """Render episode audio, re-synthesizing only the script chunks that changed"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        episode_model = PodcastEpisode(request.db)
+        episode = episode_model.get_episode_by_id(episode_id)
+        if not episode:
+            return jsonify({'error': 'Episode not found'}), 404
+        
+        text = episode_model.get_script_text(episode)
+        if not text.strip():
+            return jsonify({'error': 'Episode has no script'}), 400
+        
+        audio = episode.get('audio') or {}
+        voice_mode = int(data.get('voice_mode', audio.get('voiceMode', 0)))
+        
+        # Lazy mode renders the opening minutes now and the rest as it is
+        # listened to
+        if data.get('lazy'):
+            result = lazy_synthesis.start_lazy_render(request.db, episode_id, voice_mode)
+            return jsonify({
+                'message': 'Episode audio rendering lazily',
+                'chunks': result['chunks'],
+                'rendered': result['rendered'],
+                'synthesized': result['synthesized'],
+                'rendered_seconds': result['renderedSeconds'],
+                'total_seconds': result['totalSeconds']
+            }), 200
+        
+        # Low-bitrate HLS renditions come out of the same render (episodes
+        # packaged before stay packaged), and scripts with several segments
+        # or voices are rendered segment by segment
+        result = episode_render.render_episode(request.db, episode, voice_mode,
+                                               hls=bool(data['hls']) if 'hls' in data else None,
+                                               segmented=data.get('segments'))
+        segments = result.get('segments')
+        
+        response = {
+            'message': 'Episode audio rendered successfully',
+            'file_path': result['filePath'],
+            'chunks': result['chunks'],
+            'unchanged': result['unchanged'],
+            'synthesized': result['synthesized'],
+            'removed': result['removed'],
+            'fallback': result['fallback']
+        }
+        if segments is not None:
+            response['segments'] = segments
+            response['total_seconds'] = result['totalSeconds']
+        if result['hls'] is not None:
+            response['hls'] = result['hls']
+            response['hls_url'] = f"/api/podcast-episodes/{episode_id}/audio/hls/{result['hls']['playlist']}"
+        return jsonify(response), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@podcast_episodes_bp.route('/<episode_id>/audio/playlist', methods=['GET'])
+def get_audio_playlist(episode_id):
+    """Chunk playlist of an episode's audio, with start times"""
+    try:
+        episode_model = PodcastEpisode(request.db)
+        episode = episode_model.get_episode_by_id(episode_id)
+        if not episode:
+            return jsonify({'error': 'Episode not found'}), 404
+        
+        audio = episode.get('audio') or {}
+        if not audio.get('chunkPlan'):
+            return jsonify({'error': 'Episode audio has not been rendered'}), 404
+        
+        chunks = []
+        start = 0.0
+        for index, entry in enumerate(audio['chunkPlan']):
+            # Segmented renders record where each chunk starts, gaps included
+            start = entry.get('start', start)
+            chunks.append({
+                'index': index,
+                'start': round(start, 2),
+                'seconds': entry['seconds'],
+                'rendered': os.path.exists(lazy_synthesis.chunk_path(episode_id, entry['key'])),
+                # Pinned to the chunk's content key: an edit gives a new URL
+                'url': f"/api/podcast-episodes/{episode_id}/audio/chunks/{index}?v={entry['key']}"
+            })
+            start += entry['seconds']
+        
+        return jsonify({
+            'episode_id': episode_id,
+            'lazy': audio.get('lazy', False),
+            'total_seconds': round(start, 2),
+            'chunks': chunks
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@podcast_episodes_bp.route('/<episode_id>/audio/chunks/<int:index>', methods=['GET'])
+def get_audio_chunk(episode_id, index):
+    """One chunk of an episode's audio, rendered on demand if playback got ahead"""
+    try:
+        episode_model = PodcastEpisode(request.db)
+        episode = episode_model.get_episode_by_id(episode_id)
+        if not episode:
+            return jsonify({'error': 'Episode not found'}), 404
+        
+        plan = (episode.get('audio') or {}).get('chunkPlan') or []
+        if index < 0 or index >= len(plan):
+            return jsonify({'error': 'Chunk not found'}), 404
+        
+        file_path = lazy_synthesis.chunk_path(episode_id, plan[index]['key'])
+        if not os.path.exists(file_path):
+            position = sum(entry['seconds'] for entry in plan[:index])
+            lazy_synthesis.render_ahead(request.db, episode_id, position, plan[index]['seconds'])
+            lazy_synthesis.on_playback_progress(request.db, episode_id, position)
+        if not os.path.exists(file_path):
+            return jsonify({'error': 'Chunk is no longer part of the episode'}), 410
+        
+        # The same index serves different audio after an edit, so only URLs
+        # pinned to the current content key are cached long-term, and not
+        # while a failover tier's audio stands in for the chunk
+        key = plan[index]['key']
+        immutable = request.args.get('v') == key and chunkReady(lazy_synthesis.chunk_dir(episode_id), key)
+        return audio_delivery.send_audio(file_path, immutable=immutable)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+HLS_MIMETYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.m4s': 'audio/mp4',
+    '.mp4': 'audio/mp4'
+}
+
+@podcast_episodes_bp.route('/<episode_id>/audio/hls/<path:name>', methods=['GET'])
+def get_audio_hls(episode_id, name):
+    """Master playlist, rendition playlists and segments of an episode's HLS package"""
+    try:
+        episode_model = PodcastEpisode(request.db)
+        episode = episode_model.get_episode_by_id(episode_id)
+        if not episode:
+            return jsonify({'error': 'Episode not found'}), 404
+        if not (episode.get('audio') or {}).get('hls'):
+            return jsonify({'error': 'Episode audio has not been packaged for streaming'}), 404
+        
+        mimetype = HLS_MIMETYPES.get(os.path.splitext(name)[1])
+        if mimetype is None:
+            return jsonify({'error': 'File not found'}), 404
+        # A re-render rewrites files under the same names, so they are served
+        # with ETags for revalidation rather than a long max-age
+        return send_from_directory(os.path.abspath(lazy_synthesis.hls_dir(episode_id)), name, mimetype=mimetype)
+        
+    except NotFound:
+        return jsonify({'error': 'File not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @podcast_episodes_bp.route('/<episode_id>/analytics', methods=['PUT'])
 def update_episode_analytics(episode_id):
     """Update episode analytics"""
@@ -179,6 +342,8 @@ def delete_episode(episode_id):
         
         if result.deleted_count == 0:
             return jsonify({'error': 'Episode not found'}), 404
+        audio_store.release(request.db, f"episode:{episode_id}")
+        lazy_synthesis.remove_episode_files(episode_id)
         
         return jsonify({
             'message': 'Episode deleted successfully',
@@ -1,13 +1,20 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, Response
 import os
+import re
 import uuid
 from datetime import datetime
-from voice_generator import generate_audio_from_text
+from voice_generator import generate_audio_from_text, streamVoiceOver
+from render_profile import RenderProfile
+from models.voice_generation_job import VoiceGenerationJob
+from services import audio_delivery, audio_store
 import logging
 
 # Create blueprint
 voice_generation_bp = Blueprint('voice_generation', __name__)
 
+# Output names become paths under generated_audio, so no separators or dots
+FILENAME_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,100}')
+
 @voice_generation_bp.route('/generate-audio', methods=['POST'])
 def generate_audio():
     """
@@ -25,6 +32,11 @@ def generate_audio():
         text = data['text']
         voice_mode = data.get('voice_mode', 0)  # Default to sleepy voice
         output_filename = data.get('filename', f"napcast_{uuid.uuid4().hex[:8]}")
+        if not isinstance(output_filename, str) or not FILENAME_PATTERN.fullmatch(output_filename):
+            return jsonify({
+                'status': 'error',
+                'message': 'Filename may only contain letters, digits, "_" and "-"'
+            }), 400
         
         if not text.strip():
             return jsonify({
@@ -32,8 +44,66 @@ def generate_audio():
                 'message': 'Text cannot be empty'
             }), 400
         
-        # Generate the audio file
-        audio_path = generate_audio_from_text(text, voice_mode, output_filename)
+        # Streaming mode: send MP3 frames as soon as the first chunks are
+        # rendered; the full file is still written to generated_audio and
+        # handed to the audio store once it is complete, unless a failover
+        # tier served part of it
+        if data.get('stream'):
+            os.makedirs(audio_delivery.AUDIO_DIR, exist_ok=True)
+            audio_path = os.path.join(audio_delivery.AUDIO_DIR, f"{output_filename}.mp3")
+            db = request.db
+            key = audio_store.render_key(text, voice_mode, data.get('rate'), data.get('stupify', False))
+            ref = f"job:{data['job_id']}" if data.get('job_id') else None
+
+            def published(path, fallback_chunks):
+                if not fallback_chunks:
+                    audio_store.adopt(db, key, path, ref)
+
+            frames = streamVoiceOver(text, voice_mode, data.get('stupify', False), fileName=output_filename, output=audio_path,
+                                     onPublished=published, rate=data.get('rate'))
+            return Response(frames, mimetype='audio/mpeg', headers={
+                'Cache-Control': 'no-cache',
+                'X-Audio-Filename': f"{output_filename}.mp3",
+                'X-Voice-Mode': str(voice_mode)
+            })
+        
+        os.makedirs(audio_delivery.AUDIO_DIR, exist_ok=True)
+        audio_path = os.path.join(audio_delivery.AUDIO_DIR, f"{output_filename}.mp3")
+        
+        # Render in-process, always profiled so failover chunks show up; the
+        # report is returned when asked for and attached to the voice
+        # generation job when one is given
+        profile = RenderProfile(jobId=data.get('job_id'), voiceMode=voice_mode)
+        wants_report = data.get('profile') or data.get('job_id')
+        
+        # Identical inputs were rendered before: link the stored audio instead
+        # (profiled renders always run, so there is something to profile)
+        key = audio_store.render_key(text, voice_mode, data.get('rate'), data.get('stupify', False))
+        ref = f"job:{data['job_id']}" if data.get('job_id') else None
+        cached = None
+        if not data.get('force') and not data.get('profile'):
+            cached = audio_store.lookup(request.db, key, audio_path, ref)
+        
+        report = None
+        if cached is None:
+            audio = generate_audio_from_text(text, voice_mode, data.get('rate'), data.get('stupify', False), profile=profile)
+            full_report = profile.report()
+            report = full_report if wants_report else None
+            audio_store.write_file(audio_path, audio)
+            # The key names the requested provider; failover audio is not it
+            if not full_report.get('fallbackChunks'):
+                audio_store.adopt(request.db, key, audio_path, ref)
+            # The audio is done either way; a bad job id only loses the report
+            if data.get('job_id'):
+                try:
+                    VoiceGenerationJob(request.db).attach_profile(data['job_id'], full_report)
+                except Exception as e:
+                    logging.error(f"Could not attach render profile to job {data['job_id']}: {str(e)}")
+        
+        # Return the MP3 itself instead of a path when asked to
+        etag = audio_store.stored_etag(request.db, audio_path)
+        if data.get('response') == 'audio':
+            return audio_delivery.send_audio(audio_path, download_name=f"{output_filename}.mp3", etag=etag)
         
         if audio_path and os.path.exists(audio_path):
             return jsonify({
@@ -41,8 +111,11 @@ def generate_audio():
                 'message': 'Audio generated successfully',
                 'audio_path': audio_path,
                 'filename': f"{output_filename}.mp3",
+                'download_url': audio_delivery.versioned_url(f"/api/voice-generation/download-audio/{output_filename}.mp3", audio_path, etag),
                 'voice_mode': voice_mode,
-                'generated_at': datetime.now().isoformat()
+                'cached': cached is not None,
+                'generated_at': datetime.now().isoformat(),
+                'profile': report
             })
         else:
             return jsonify({
@@ -60,19 +133,20 @@ def generate_audio():
 @voice_generation_bp.route('/download-audio/<filename>', methods=['GET'])
 def download_audio(filename):
     """
-    Download generated audio file
+    Download generated audio file, with byte ranges and content ETags.
+    Add ?v=<etag> (see download_url) for a response cached long-term.
     """
     try:
-        audio_dir = "generated_audio"
-        file_path = os.path.join(audio_dir, filename)
+        file_path = audio_delivery.resolve(filename)
         
-        if not os.path.exists(file_path):
+        if file_path is None:
             return jsonify({
                 'status': 'error',
                 'message': 'Audio file not found'
             }), 404
         
-        return send_file(file_path, as_attachment=True, download_name=filename)
+        return audio_delivery.send_audio(file_path, download_name=filename, as_attachment=True,
+                                         etag=audio_store.stored_etag(request.db, file_path))
         
     except Exception as e:
         logging.error(f"Error downloading audio: {str(e)}")
@@ -81,6 +155,42 @@ def download_audio(filename):
             'message': f'Error downloading file: {str(e)}'
         }), 500
 
+@voice_generation_bp.route('/audio-store/stats', methods=['GET'])
+def get_audio_store_stats():
+    """
+    Usage, dedupe savings and hit rate of the generated-audio store
+    """
+    try:
+        return jsonify({
+            'status': 'success',
+            'stats': audio_store.stats(request.db)
+        })
+    except Exception as e:
+        logging.error(f"Error reading audio store stats: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Internal server error: {str(e)}'
+        }), 500
+
+@voice_generation_bp.route('/audio-store/evict', methods=['POST'])
+def evict_audio_store():
+    """
+    Run the evictor now, optionally against a smaller quota (quota_mb)
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        quota = int(float(data['quota_mb']) * 1024 * 1024) if 'quota_mb' in data else audio_store.QUOTA_BYTES
+        return jsonify({
+            'status': 'success',
+            'result': audio_store.evict(request.db, quota)
+        })
+    except Exception as e:
+        logging.error(f"Error evicting audio store: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Internal server error: {str(e)}'
+        }), 500
+
 @voice_generation_bp.route('/voice-modes', methods=['GET'])
 def get_voice_modes():
     """
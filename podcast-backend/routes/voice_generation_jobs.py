@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from models.voice_generation_job import VoiceGenerationJob
+from services import audio_store, prerender_scheduler
 from datetime import datetime
 from bson import ObjectId
 
@@ -28,6 +29,56 @@ def create_job():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@voice_jobs_bp.route('/prerender/run', methods=['POST'])
+def run_prerender():
+    """Queue a pre-render pass; it renders only if the current hour is off-peak"""
+    try:
+        data = request.get_json(silent=True) or {}
+        budget = float(data.get('budget_minutes', prerender_scheduler.PRERENDER_BUDGET_MINUTES))
+        
+        status = prerender_scheduler.request_run(request.db, budget_minutes=budget, force=bool(data.get('force')))
+        
+        return jsonify(status), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@voice_jobs_bp.route('/prerender/status', methods=['GET'])
+def get_prerender_status():
+    """Running and last pre-render passes"""
+    try:
+        return jsonify(prerender_scheduler.run_status(request.db)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@voice_jobs_bp.route('/prerender/plan', methods=['GET'])
+def get_prerender_plan():
+    """Predicted sessions and the episodes that would be pre-rendered"""
+    try:
+        plan, demand = prerender_scheduler.plan_prerenders(request.db)
+        for job in plan:
+            job['session'] = job['session'].isoformat()
+        
+        return jsonify({
+            'plan': plan,
+            'predicted_sessions_by_hour': {str(hour): count for hour, count in sorted(demand.items())}
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@voice_jobs_bp.route('/prerender/report', methods=['GET'])
+def get_prerender_report():
+    """Report how much bedtime demand pre-rendering moved off-peak"""
+    try:
+        days = int(request.args.get('days', 7))
+        
+        return jsonify(prerender_scheduler.demand_shift_report(request.db, days)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @voice_jobs_bp.route('/<job_id>', methods=['GET'])
 def get_job(job_id):
     """Get a specific job by ID"""
@@ -157,6 +208,29 @@ def update_job_progress(job_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@voice_jobs_bp.route('/<job_id>/profile', methods=['PUT'])
+def attach_job_profile(job_id):
+    """Attach a render profile report (voice_generator.py --profile) to a job"""
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('profile'), dict):
+            return jsonify({'error': 'Profile report is required'}), 400
+        
+        job_model = VoiceGenerationJob(request.db)
+        result = job_model.attach_profile(job_id, data['profile'])
+        
+        if result.matched_count == 0:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify({
+            'message': 'Profile attached successfully',
+            'modified_count': result.modified_count
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @voice_jobs_bp.route('/<job_id>/retry', methods=['POST'])
 def retry_job(job_id):
     """Retry a failed job"""
@@ -212,6 +286,7 @@ def delete_job(job_id):
         
         if result.deleted_count == 0:
             return jsonify({'error': 'Job not found'}), 404
+        audio_store.release(request.db, f"job:{job_id}")
         
         return jsonify({
             'message': 'Job deleted successfully',
@@ -0,0 +1,110 @@
+"""
+Serving generated audio files.
+
+Responses carry a strong ETag taken from the file's content, so a re-render
+that produces the same audio keeps client caches valid and one that changes
+it invalidates them. Callers pass the hash the audio store recorded when
+the file was rendered; files outside the store are hashed here, once per
+worker and file version. Byte ranges (seeking, resumed downloads) and
+If-None-Match / If-Range are answered by Werkzeug's conditional responses.
+URLs that carry the content hash (?v=<etag>) never change meaning and are
+cached for a year; plain URLs are revalidated.
+
+With NAPCAST_SENDFILE set to 'x-accel' (nginx) or 'x-sendfile' (Apache,
+lighttpd) the worker only sends headers and the front proxy streams the
+bytes, ranges included. For nginx, NAPCAST_ACCEL_PREFIX must be an
+internal location aliased to the audio directory.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, request, send_file
+from werkzeug.security import safe_join
+
+AUDIO_DIR = "generated_audio"
+SENDFILE_MODE = os.getenv('NAPCAST_SENDFILE', '').lower()
+ACCEL_PREFIX = os.getenv('NAPCAST_ACCEL_PREFIX', '/protected-audio/')
+CACHE_MAX_AGE = int(os.getenv('NAPCAST_AUDIO_MAX_AGE', str(365 * 24 * 3600)))
+HASH_BLOCK_BYTES = 1024 * 1024
+ETAG_CACHE_SIZE = 4096
+
+_etags = OrderedDict()
+_lock = threading.Lock()
+
+def resolve(filename, directory=AUDIO_DIR):
+    """Path of filename inside directory, or None if it escapes it or is missing"""
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+def content_etag(path):
+    """SHA-256 of a file's content, recomputed only when the file changes"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if key in _etags:
+            _etags.move_to_end(key)
+            return _etags[key]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    etag = digest.hexdigest()
+
+    with _lock:
+        _etags[key] = etag
+        while len(_etags) > ETAG_CACHE_SIZE:
+            _etags.popitem(last=False)
+    return etag
+
+def versioned_url(url, path, etag=None):
+    """url pinned to the current content of path, cacheable for CACHE_MAX_AGE"""
+    return f"{url}?v={etag or content_etag(path)}"
+
+def send_audio(path, download_name=None, as_attachment=False, immutable=None, mimetype='audio/mpeg', etag=None):
+    """Response for an audio file with content ETag, ranges and cache headers.
+
+    etag is the file's known content hash; without one it is computed.
+    immutable marks the URL as content-addressed (long max-age); by default
+    that is the case when the request's v parameter matches the ETag.
+    """
+    etag = etag or content_etag(path)
+    if immutable is None:
+        immutable = request.args.get('v') == etag
+
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(AUDIO_DIR))
+    # The nginx location only covers the audio directory
+    offload = SENDFILE_MODE == 'x-sendfile' or (SENDFILE_MODE == 'x-accel' and not relative.startswith('..'))
+
+    if offload:
+        response = Response(mimetype=mimetype)
+        if SENDFILE_MODE == 'x-accel':
+            response.headers['X-Accel-Redirect'] = ACCEL_PREFIX.rstrip('/') + '/' + relative.replace(os.sep, '/')
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        response.headers['Accept-Ranges'] = 'bytes'
+        if download_name:
+            response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline', filename=download_name)
+        response.set_etag(etag)
+        # 304s are answered here; the proxy only handles full and range reads
+        response.make_conditional(request)
+    else:
+        # Absolute, or Flask would resolve the path against the app's root
+        response = send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=as_attachment, download_name=download_name,
+                             conditional=True, etag=etag)
+
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = CACHE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    else:
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        response.cache_control.max_age = None
+    return response
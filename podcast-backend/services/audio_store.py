@@ -0,0 +1,271 @@
+"""
+Content-addressed store for generated audio.
+
+Every rendered file is kept once under STORE_ROOT/<key[:2]>/<key>.mp3,
+where the key hashes what the audio was rendered from: text, provider,
+voice, rate and transforms for generate-audio, or the chunk plan for an
+episode. The names the rest of the app uses (generated_audio/napcast_*.mp3,
+episode_<id>.mp3) are hard links to that object, so an identical render is
+a link instead of another copy and a repeated request skips rendering.
+
+Objects are indexed in the audioObjects collection with the set of refs
+that pin them ('episode:<id>', 'job:<id>'), the links pointing at them and
+the SHA-256 of their content, hashed once when they are stored and served
+as their ETag.
+Unpinned objects, such as ad-hoc generate-audio files, are a cache. A background evictor keeps the store under
+NAPCAST_AUDIO_QUOTA_MB: least recently used unreferenced objects go first,
+then referenced ones, whose episodes are flagged for re-rendering. Files
+in NAPCAST_AUDIO_SWEEP_DIRS (such as the Node backend's temp directory)
+are removed once they are older than NAPCAST_AUDIO_SWEEP_HOURS, and so are
+the chunk and HLS directories of deleted episodes.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from tts_cache import contentKey
+from voice_generator import getProvider, voiceModeSettings, PITCH_PRESERVING_MODES
+
+STORE_ROOT = os.getenv('NAPCAST_AUDIO_STORE_DIR', os.path.join('generated_audio', 'store'))
+QUOTA_BYTES = int(os.getenv('NAPCAST_AUDIO_QUOTA_MB', '10240')) * 1024 * 1024
+EVICT_INTERVAL_SECONDS = int(os.getenv('NAPCAST_AUDIO_EVICT_SECONDS', '300'))
+SWEEP_DIRS = [d for d in os.getenv('NAPCAST_AUDIO_SWEEP_DIRS', '').split(os.pathsep) if d]
+SWEEP_AGE_SECONDS = float(os.getenv('NAPCAST_AUDIO_SWEEP_HOURS', '24')) * 3600
+STATS_ID = 'audioStore'
+HASH_BLOCK_BYTES = 1024 * 1024
+
+_evictor = None
+_evictor_lock = threading.Lock()
+
+def render_key(text, voice_mode, rate=None, stupify=False):
+    """Key for generate-audio output rendered from these inputs"""
+    settings = voiceModeSettings(voice_mode)
+    if settings is None:
+        raise ValueError(f"Unknown voice mode: {voice_mode}")
+    tts_mode, voice, mode_rate = settings
+    provider = getProvider(tts_mode)
+    variant = ('pitch' if voice_mode in PITCH_PRESERVING_MODES else '') + (':stupify' if stupify else '')
+    return contentKey(provider.name, provider.model(voice), mode_rate if rate is None else rate, text, variant)
+
+def plan_key(plan):
+    """Key for an episode rendered from a chunk plan"""
+    layout = '\n'.join(f"{entry['key']}@{entry.get('start', '')}" for entry in plan)
+    return hashlib.sha256(layout.encode('utf-8')).hexdigest()
+
+def object_path(key):
+    return os.path.join(STORE_ROOT, key[:2], f'{key}.mp3')
+
+def content_hash(path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _count(db, **fields):
+    db.audioStoreStats.update_one({'_id': STATS_ID}, {'$inc': fields}, upsert=True)
+
+def _link(source, destination):
+    # Hard link destination to source, replacing destination atomically;
+    # copies when the two are on different filesystems
+    directory = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+def write_file(path, data):
+    """Write data to path through a new inode.
+
+    path may be a link to a stored object; writing into it in place would
+    change the object and every other link to it.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp files are owner-only; the proxy may serve these directly
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+
+def _detach(db, path, ref=None):
+    # path and ref now belong to another object
+    db.audioObjects.update_many({'links': path}, {'$pull': {'links': path}})
+    if ref:
+        db.audioObjects.update_many({'refs': ref}, {'$pull': {'refs': ref}})
+
+def lookup(db, key, destination=None, ref=None):
+    """Stored path for key, linked to destination when given, or None on a miss"""
+    path = object_path(key)
+    if not os.path.exists(path):
+        _count(db, misses=1)
+        return None
+    if destination:
+        _detach(db, destination, ref)
+        _link(path, destination)
+    update = {'$set': {'lastAccessed': datetime.utcnow()}, '$inc': {'hits': 1}}
+    if destination:
+        update['$addToSet'] = {'links': destination}
+    if ref:
+        update.setdefault('$addToSet', {})['refs'] = ref
+    db.audioObjects.update_one({'_id': key}, update)
+    _count(db, hits=1, dedupedBytes=os.path.getsize(path))
+    return path
+
+def adopt(db, key, path, ref=None):
+    """Move a freshly rendered file at path into the store under key.
+
+    path stays where it is, as a link to the stored object. If the store
+    already holds the same audio, path is replaced by a link to it and the
+    new copy's space is freed.
+    """
+    stored = object_path(key)
+    size = os.path.getsize(path)
+    _detach(db, path, ref)
+    etag = None
+    if os.path.exists(stored):
+        _link(stored, path)
+        _count(db, dedupedBytes=size)
+        etag = (db.audioObjects.find_one({'_id': key}, {'etag': 1}) or {}).get('etag')
+    else:
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        try:
+            os.link(path, stored)
+        except FileExistsError:
+            _link(stored, path)
+        except OSError:
+            _link(path, stored)
+        _count(db, stores=1)
+    now = datetime.utcnow()
+    update = {
+        '$set': {'path': stored, 'bytes': os.path.getsize(stored), 'etag': etag or content_hash(stored), 'lastAccessed': now},
+        '$setOnInsert': {'createdAt': now, 'hits': 0},
+        '$addToSet': {'links': path}
+    }
+    if ref:
+        update['$addToSet']['refs'] = ref
+    db.audioObjects.update_one({'_id': key}, update, upsert=True)
+    ensure_evictor(db)
+    return stored
+
+def stored_etag(db, path):
+    """Recorded content hash of path, or None if it is not a current link into the store"""
+    obj = db.audioObjects.find_one({'links': path}, {'path': 1, 'etag': 1})
+    if not obj or not obj.get('etag'):
+        return None
+    try:
+        # Replaced by a file that was never adopted
+        return obj['etag'] if os.path.samefile(path, obj['path']) else None
+    except OSError:
+        return None
+
+def release(db, ref):
+    """Drop a ref (a deleted episode or job); its objects become evictable"""
+    return db.audioObjects.update_many({'refs': ref}, {'$pull': {'refs': ref}}).modified_count
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def evict(db, quota_bytes=QUOTA_BYTES):
+    """Delete least recently used objects until the store fits in quota_bytes"""
+    from models.podcast_episode import PodcastEpisode
+
+    objects = list(db.audioObjects.find({}, {'bytes': 1, 'refs': 1, 'links': 1, 'lastAccessed': 1}))
+    used = sum(obj.get('bytes', 0) for obj in objects)
+    evicted = []
+    # Unreferenced objects first, each group oldest first
+    for obj in sorted(objects, key=lambda o: (bool(o.get('refs')), o.get('lastAccessed') or datetime.min)):
+        if used <= quota_bytes:
+            break
+        for link in obj.get('links', []):
+            # A link only belongs to the object while it is still the same file
+            if os.path.exists(link) and os.path.exists(object_path(obj['_id'])) and os.path.samefile(link, object_path(obj['_id'])):
+                _remove(link)
+        _remove(object_path(obj['_id']))
+        db.audioObjects.delete_one({'_id': obj['_id']})
+        for ref in obj.get('refs', []):
+            kind, _, ref_id = ref.partition(':')
+            if kind == 'episode':
+                PodcastEpisode(db).mark_audio_evicted(ref_id)
+        used -= obj.get('bytes', 0)
+        evicted.append(obj['_id'])
+    if evicted:
+        _count(db, evictions=len(evicted))
+    from services import lazy_synthesis
+    return {'evicted': len(evicted), 'bytes': used, 'quotaBytes': quota_bytes, 'swept': sweep(),
+            'orphanedDirs': lazy_synthesis.remove_orphaned_dirs(db)}
+
+def sweep(directories=None, max_age=SWEEP_AGE_SECONDS):
+    """Remove files older than max_age from scratch directories outside the store"""
+    cutoff = time.time() - max_age
+    removed = 0
+    for directory in directories if directories is not None else SWEEP_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+def stats(db):
+    """Usage, dedupe and hit rates of the store"""
+    objects = list(db.audioObjects.find({}, {'bytes': 1, 'refs': 1, 'links': 1}))
+    counters = db.audioStoreStats.find_one({'_id': STATS_ID}) or {}
+    hits = counters.get('hits', 0)
+    misses = counters.get('misses', 0)
+    used = sum(obj.get('bytes', 0) for obj in objects)
+    return {
+        'objects': len(objects),
+        'bytes': used,
+        'quotaBytes': QUOTA_BYTES,
+        'usage': round(used / QUOTA_BYTES, 4) if QUOTA_BYTES else 0.0,
+        'unreferenced': len([obj for obj in objects if not obj.get('refs')]),
+        'links': sum(len(obj.get('links', [])) for obj in objects),
+        'hits': hits,
+        'misses': misses,
+        'hitRate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        'stores': counters.get('stores', 0),
+        'dedupedBytes': counters.get('dedupedBytes', 0),
+        'evictions': counters.get('evictions', 0)
+    }
+
+def ensure_evictor(db, interval=EVICT_INTERVAL_SECONDS):
+    """Start the background evictor for this process if it is not running"""
+    global _evictor
+    with _evictor_lock:
+        if _evictor is None or not _evictor.is_alive():
+            _evictor = threading.Thread(target=_evict_forever, args=(db, interval), name='audio-evictor', daemon=True)
+            _evictor.start()
+    return _evictor
+
+def _evict_forever(db, interval):
+    while True:
+        try:
+            evict(db)
+        except Exception as e:
+            print(f"Audio store eviction failed: {e}")
+        time.sleep(interval)
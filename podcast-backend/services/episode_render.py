@@ -0,0 +1,55 @@
+"""
+Full renders of an episode's audio.
+
+Used by the render-audio route and by off-peak pre-rendering. Only the
+script chunks that changed since the previous render are synthesized; the
+chunks live in the episode's chunk directory (see lazy_synthesis). The
+finished file is generated_audio/episode_<id>.mp3, pinned in the audio
+store under the episode's ref, and the new chunk plan is saved on the
+episode.
+"""
+
+import os
+
+from models.podcast_episode import PodcastEpisode
+from services import audio_store, lazy_synthesis
+from services.audio_delivery import AUDIO_DIR
+from voice_generator import renderIncremental, renderSegments
+
+def episode_path(episode_id):
+    """Path of an episode's rendered audio file"""
+    return os.path.join(AUDIO_DIR, f"episode_{episode_id}.mp3")
+
+def render_episode(db, episode, voice_mode, hls=None, segmented=None):
+    """Render an episode and record the result.
+
+    hls and segmented default to how the episode was rendered before: HLS
+    packages stay packaged, and scripts with several segments or voices are
+    rendered segment by segment and laid out at the segments' timestamps.
+    Returns the renderer's result with the episode's file path added.
+    """
+    episode_model = PodcastEpisode(db)
+    episode_id = str(episode['_id'])
+    audio = episode.get('audio') or {}
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    file_path = episode_path(episode_id)
+    hls_dir = lazy_synthesis.hls_dir(episode_id) if (bool(audio.get('hls')) if hls is None else hls) else None
+    chunk_dir = lazy_synthesis.chunk_dir(episode_id)
+
+    if episode_model.is_multi_voice(episode) if segmented is None else segmented:
+        result = renderSegments(episode_model.get_script_segments(episode), voice_mode, file_path,
+                                chunk_dir, audio.get('chunkPlan'), hls=hls_dir)
+    else:
+        result = renderIncremental(episode_model.get_script_text(episode), voice_mode, file_path,
+                                   chunk_dir, audio.get('chunkPlan'), hls=hls_dir)
+
+    # Failover-tier chunks are rendered again next time, so the episode
+    # only enters the audio store once all of it came from its own voice
+    if result['fallback']:
+        audio_store.release(db, f"episode:{episode_id}")
+    else:
+        audio_store.adopt(db, audio_store.plan_key(result['plan']), file_path, f"episode:{episode_id}")
+    episode_model.save_audio_render(episode_id, file_path, voice_mode, result['plan'],
+                                    segments=result.get('segments'), hls=result['hls'])
+    result['filePath'] = file_path
+    return result
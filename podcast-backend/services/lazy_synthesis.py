@@ -0,0 +1,132 @@
+"""
+Listen-driven synthesis for episodes rendered in lazy mode.
+
+Only the opening minutes of a lazy episode are synthesized when it is
+rendered. Playback-progress analytics events then render the chunks just
+ahead of the listener in the background, so TTS spend and storage follow
+what is actually listened to. Chunk files live in the per-episode chunk
+directory shared with incremental renders.
+"""
+
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import ObjectId
+from models.podcast_episode import PodcastEpisode
+from voice_generator import renderLazy, LAZY_AHEAD_SECONDS, LAZY_EAGER_SECONDS
+
+CHUNK_ROOT = os.getenv('NAPCAST_EPISODE_CHUNK_DIR', os.path.join('generated_audio', 'chunks'))
+HLS_ROOT = os.getenv('NAPCAST_EPISODE_HLS_DIR', os.path.join('generated_audio', 'hls'))
+PLAYBACK_PROGRESS = 'playback_progress'
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('NAPCAST_LAZY_WORKERS', '2')), thread_name_prefix='lazy-render')
+_pending = {}
+_lock = threading.Lock()
+
+def chunk_dir(episode_id):
+    """Directory holding an episode's rendered chunks"""
+    return os.path.join(CHUNK_ROOT, str(episode_id))
+
+def chunk_path(episode_id, key):
+    return os.path.join(chunk_dir(episode_id), f'{key}.mp3')
+
+def hls_dir(episode_id):
+    """Directory holding an episode's HLS package"""
+    return os.path.join(HLS_ROOT, str(episode_id))
+
+def remove_episode_files(episode_id):
+    """Delete an episode's chunk directory and HLS package"""
+    for directory in (chunk_dir(episode_id), hls_dir(episode_id)):
+        shutil.rmtree(directory, ignore_errors=True)
+
+def remove_orphaned_dirs(db, min_age=3600):
+    """Delete chunk and HLS directories of episodes that no longer exist.
+
+    Directories changed within min_age seconds are left alone, so a render
+    that is still starting up keeps its files.
+    """
+    cutoff = time.time() - min_age
+    removed = 0
+    for root in (CHUNK_ROOT, HLS_ROOT):
+        if not os.path.isdir(root):
+            continue
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if not ObjectId.is_valid(name) or not os.path.isdir(path):
+                continue
+            try:
+                if os.path.getmtime(path) >= cutoff or db.podcastEpisodes.count_documents({'_id': ObjectId(name)}, limit=1):
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+def start_lazy_render(db, episode_id, voice_mode, eager_seconds=LAZY_EAGER_SECONDS):
+    """Plan an episode and render its first eager_seconds of audio"""
+    episode_model = PodcastEpisode(db)
+    episode = episode_model.get_episode_by_id(episode_id)
+    if not episode:
+        return None
+    audio = episode.get('audio') or {}
+    result = renderLazy(episode_model.get_script_text(episode), voice_mode, chunk_dir(episode_id),
+                        audio.get('chunkPlan'), 0.0, eager_seconds)
+    episode_model.save_audio_render(episode_id, None, voice_mode, result['plan'], lazy=True)
+    return result
+
+def render_ahead(db, episode_id, position, ahead_seconds=LAZY_AHEAD_SECONDS):
+    """Render the chunks that play within ahead_seconds of position"""
+    episode_model = PodcastEpisode(db)
+    episode = episode_model.get_episode_by_id(episode_id)
+    audio = (episode or {}).get('audio') or {}
+    if not audio.get('lazy'):
+        return None
+    result = renderLazy(episode_model.get_script_text(episode), audio['voiceMode'], chunk_dir(episode_id),
+                        audio.get('chunkPlan'), position, ahead_seconds)
+    if result['synthesized'] or result['removed'] or audio.get('stale'):
+        episode_model.update_chunk_plan(episode_id, result['plan'])
+    return result
+
+def on_playback_progress(db, episode_id, position):
+    """Queue a background render ahead of a listener's playback position.
+
+    Events for an episode that is already rendering only move its target
+    position forward; the running job picks that up when it finishes.
+    """
+    episode_id = str(episode_id)
+    with _lock:
+        running = episode_id in _pending
+        _pending[episode_id] = max(position, _pending.get(episode_id, 0.0))
+    if not running:
+        _executor.submit(_render_until_caught_up, db, episode_id)
+    return not running
+
+def _render_until_caught_up(db, episode_id):
+    done = None
+    while True:
+        with _lock:
+            position = _pending[episode_id]
+            if done is not None and position <= done:
+                del _pending[episode_id]
+                return
+        try:
+            render_ahead(db, episode_id, position)
+        except Exception as e:
+            print(f"Lazy render for episode {episode_id} failed: {e}")
+            with _lock:
+                del _pending[episode_id]
+            return
+        done = position
+
+def playback_position(data):
+    """Playback position in seconds from an analytics event, if it has one"""
+    metadata = data.get('metadata') or (data.get('event') or {}).get('metadata') or {}
+    position = metadata.get('position', data.get('value'))
+    try:
+        return float(position)
+    except (TypeError, ValueError):
+        return None
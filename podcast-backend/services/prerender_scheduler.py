@@ -0,0 +1,334 @@
+"""
+Off-peak pre-rendering of tonight's episodes.
+
+Voice generation demand peaks at bedtime, when everyone asks for tonight's
+episode at once. This scheduler predicts each user's next listening session
+from their sleep preferences and recent listening history, picks the
+episode they are most likely to play (highest userPrompts priority first)
+and renders it ahead of time, but only while the current hour is off-peak
+and only up to a budget of audio minutes per run.
+
+Passes run on a background thread (ensure_runner) every
+NAPCAST_PRERENDER_INTERVAL_MINUTES; request_run() asks for one right away.
+A lease in the prerenderRuns collection keeps the workers of a deployment
+from running passes at the same time, and records the last pass.
+
+demand_shift_report() shows how much rendering was moved out of bedtime:
+how many pre-rendered episodes were played, how many audio minutes that
+took off the peak, and how far ahead of the session they were rendered.
+"""
+
+import math
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from bson import ObjectId
+
+from models.podcast_episode import PodcastEpisode
+from services import episode_render
+from voice_generator import voiceModeSettings, SPEECH_CHARS_PER_SECOND
+
+PRERENDER_BUDGET_MINUTES = float(os.getenv('NAPCAST_PRERENDER_BUDGET_MINUTES', '240'))
+PRERENDER_HORIZON_HOURS = float(os.getenv('NAPCAST_PRERENDER_HORIZON_HOURS', '18'))
+DEFAULT_TIMEZONE = os.getenv('NAPCAST_DEFAULT_TIMEZONE', 'UTC')
+DEFAULT_SLEEP_TIME = '22:00'
+PRERENDER_INTERVAL_SECONDS = float(os.getenv('NAPCAST_PRERENDER_INTERVAL_MINUTES', '30')) * 60
+# How long a pass may go without finishing an episode before another
+# worker may take over
+RUN_LEASE_SECONDS = 30 * 60
+RUNS_ID = 'prerender'
+
+# An hour is off-peak when fewer sessions are predicted to start in it than
+# this fraction of the busiest hour
+OFF_PEAK_FRACTION = 0.5
+# Listening history needed before it overrides the stated preference
+MIN_HISTORY_SESSIONS = 3
+HISTORY_DAYS = 14
+PLAY_EVENTS = ['episode_play', 'playback_progress']
+
+_runner = None
+_runner_lock = threading.Lock()
+_wake = threading.Event()
+
+def parse_clock(value):
+    """Minutes after midnight for an 'HH:MM' string, or None"""
+    try:
+        hours, minutes = str(value).split(':')[:2]
+        return (int(hours) % 24) * 60 + int(minutes) % 60
+    except (TypeError, ValueError):
+        return None
+
+def circular_mean_minute(minutes):
+    """Mean time of day, treating 23:50 and 00:10 as 20 minutes apart"""
+    angles = [2 * math.pi * m / 1440 for m in minutes]
+    x = sum(math.cos(a) for a in angles)
+    y = sum(math.sin(a) for a in angles)
+    return int(round(math.atan2(y, x) / (2 * math.pi) * 1440)) % 1440
+
+def user_timezone(user):
+    # The timezone lives with the general preferences, not the sleep ones
+    preferences = ((user.get('profile') or {}).get('preferences') or {})
+    try:
+        return ZoneInfo(preferences.get('timezone') or DEFAULT_TIMEZONE)
+    except Exception:
+        return ZoneInfo('UTC')
+
+def load_session_history(db, user, since):
+    """UTC start times of the user's recent listening sessions"""
+    starts = [entry['listenedAt'] for entry in user.get('listeningHistory', [])
+              if isinstance(entry.get('listenedAt'), datetime) and entry['listenedAt'] >= since]
+    events = db.analytics.find(
+        {'userId': user['_id'], 'type': {'$in': PLAY_EVENTS}, 'timestamp': {'$gte': since}},
+        {'timestamp': 1}
+    ).sort('timestamp', 1)
+    # Progress events arrive all through a session; the first event after a
+    # gap of a few hours starts a new one
+    last = None
+    for event in events:
+        if last is None or event['timestamp'] - last > timedelta(hours=4):
+            starts.append(event['timestamp'])
+        last = event['timestamp']
+    return starts
+
+def predict_next_session(db, user, now):
+    """Predicted UTC start of the user's next session"""
+    zone = user_timezone(user)
+    history = load_session_history(db, user, now - timedelta(days=HISTORY_DAYS))
+    if len(history) >= MIN_HISTORY_SESSIONS:
+        local = [start.replace(tzinfo=ZoneInfo('UTC')).astimezone(zone) for start in history]
+        minute = circular_mean_minute([t.hour * 60 + t.minute for t in local])
+    else:
+        preferences = ((user.get('profile') or {}).get('sleepPreferences') or {})
+        minute = parse_clock(preferences.get('preferredSleepTime'))
+        if minute is None:
+            minute = parse_clock(DEFAULT_SLEEP_TIME)
+
+    local_now = now.replace(tzinfo=ZoneInfo('UTC')).astimezone(zone)
+    session = local_now.replace(hour=minute // 60, minute=minute % 60, second=0, microsecond=0)
+    if session <= local_now:
+        session += timedelta(days=1)
+    return session.astimezone(ZoneInfo('UTC')).replace(tzinfo=None)
+
+def prompt_priority(db, episode):
+    """Highest queue priority among the prompts behind an episode"""
+    prompt_ids = episode.get('sourcePrompts') or []
+    if not prompt_ids:
+        return 0
+    prompts = db.userPrompts.find({'_id': {'$in': [ObjectId(p) for p in prompt_ids]}}, {'processing.priority': 1})
+    return max((p.get('processing', {}).get('priority', 0) for p in prompts), default=0)
+
+def likely_episode(db, user_id):
+    """The episode a user will most likely play next that still needs audio"""
+    episode_model = PodcastEpisode(db)
+    candidates = []
+    for episode in db.podcastEpisodes.find({
+        'userId': user_id,
+        'status': {'$nin': ['archived']},
+        # Lazy episodes are rendered as they are listened to
+        'audio.lazy': {'$ne': True},
+        '$or': [{'audio.filePath': {'$in': [None, '']}}, {'audio': {'$exists': False}}, {'audio.stale': True}]
+    }).sort('createdAt', -1).limit(20):
+        if episode_model.get_script_text(episode).strip():
+            candidates.append((prompt_priority(db, episode), episode['createdAt'], episode))
+    if not candidates:
+        return None
+    candidates.sort(key=lambda c: (c[0], c[1]), reverse=True)
+    return candidates[0][2]
+
+def estimated_minutes(text, voice_mode):
+    _, _, rate = voiceModeSettings(voice_mode)
+    return len(text) / SPEECH_CHARS_PER_SECOND / rate / 60
+
+def plan_prerenders(db, now=None):
+    """Predicted sessions for every active user and the episode to render for each"""
+    now = now or datetime.utcnow()
+    episode_model = PodcastEpisode(db)
+    demand = Counter()
+    plan = []
+    for user in db.users.find({'isActive': {'$ne': False}}):
+        session = predict_next_session(db, user, now)
+        demand[session.hour] += 1
+        if session - now > timedelta(hours=PRERENDER_HORIZON_HOURS):
+            continue
+        episode = likely_episode(db, user['_id'])
+        if not episode:
+            continue
+        voice_mode = (episode.get('audio') or {}).get('voiceMode', 0)
+        plan.append({
+            'userId': str(user['_id']),
+            'episodeId': str(episode['_id']),
+            'session': session,
+            'priority': prompt_priority(db, episode),
+            'voiceMode': voice_mode,
+            'estimatedMinutes': round(estimated_minutes(episode_model.get_script_text(episode), voice_mode), 1)
+        })
+    # Most urgent first: high priority, then the earliest session
+    plan.sort(key=lambda job: (-job['priority'], job['session']))
+    return plan, demand
+
+def is_off_peak(demand, hour):
+    busiest = max(demand.values(), default=0)
+    return busiest == 0 or demand.get(hour, 0) < OFF_PEAK_FRACTION * busiest
+
+def prerender_episode(db, episode_id, voice_mode, session):
+    """Render one episode ahead of its predicted session"""
+    episode_model = PodcastEpisode(db)
+    episode = episode_model.get_episode_by_id(episode_id)
+    result = episode_render.render_episode(db, episode, voice_mode)
+    seconds = sum(entry['seconds'] for entry in result['plan'])
+    episode_model.mark_prerendered(episode_id, session, seconds)
+    return seconds
+
+def run_prerender(db, now=None, budget_minutes=PRERENDER_BUDGET_MINUTES, force=False, on_episode=None):
+    """Pre-render likely episodes while the current hour is off-peak.
+
+    on_episode is called after every episode, rendered or failed.
+    """
+    now = now or datetime.utcnow()
+    plan, demand = plan_prerenders(db, now)
+    off_peak = is_off_peak(demand, now.hour)
+    result = {
+        'offPeak': off_peak,
+        'hour': now.hour,
+        'predictedSessionsByHour': {str(hour): count for hour, count in sorted(demand.items())},
+        'candidates': len(plan),
+        'rendered': [],
+        'failed': [],
+        'budgetMinutes': budget_minutes,
+        'usedMinutes': 0.0
+    }
+    if not off_peak and not force:
+        return result
+
+    for job in plan:
+        if result['usedMinutes'] + job['estimatedMinutes'] > budget_minutes:
+            continue
+        try:
+            seconds = prerender_episode(db, job['episodeId'], job['voiceMode'], job['session'])
+        except Exception as e:
+            result['failed'].append({'episodeId': job['episodeId'], 'error': str(e)})
+            continue
+        finally:
+            if on_episode:
+                on_episode()
+        result['usedMinutes'] = round(result['usedMinutes'] + seconds / 60, 1)
+        result['rendered'].append({
+            'episodeId': job['episodeId'],
+            'userId': job['userId'],
+            'session': job['session'].isoformat(),
+            'minutes': round(seconds / 60, 1)
+        })
+    return result
+
+def request_run(db, budget_minutes=PRERENDER_BUDGET_MINUTES, force=False):
+    """Ask the background runner for a pass now; returns the run status"""
+    db.prerenderRuns.update_one(
+        {'_id': RUNS_ID},
+        {'$set': {'requested': {'budgetMinutes': budget_minutes, 'force': force, 'at': datetime.utcnow()}}},
+        upsert=True
+    )
+    ensure_runner(db)
+    _wake.set()
+    return run_status(db)
+
+def run_status(db):
+    """Whether a pass is running, the pending request and the last pass"""
+    runs = db.prerenderRuns.find_one({'_id': RUNS_ID}) or {}
+    lease = runs.get('leaseUntil')
+    return {
+        'running': bool(lease and lease > datetime.utcnow()),
+        'startedAt': runs.get('startedAt') if lease else None,
+        'requested': runs.get('requested'),
+        'lastRun': runs.get('lastRun'),
+        'intervalMinutes': PRERENDER_INTERVAL_SECONDS / 60
+    }
+
+def run_pass(db):
+    """Run one pass unless another worker holds the lease; returns its result or None"""
+    now = datetime.utcnow()
+    db.prerenderRuns.update_one({'_id': RUNS_ID}, {'$setOnInsert': {'leaseUntil': None}}, upsert=True)
+    claimed = db.prerenderRuns.find_one_and_update(
+        {'_id': RUNS_ID, '$or': [{'leaseUntil': None}, {'leaseUntil': {'$lt': now}}]},
+        {'$set': {'leaseUntil': now + timedelta(seconds=RUN_LEASE_SECONDS), 'startedAt': now}, '$unset': {'requested': ''}}
+    )
+    if claimed is None:
+        return None
+
+    def renew():
+        db.prerenderRuns.update_one({'_id': RUNS_ID}, {'$set': {'leaseUntil': datetime.utcnow() + timedelta(seconds=RUN_LEASE_SECONDS)}})
+
+    requested = claimed.get('requested') or {}
+    try:
+        result = run_prerender(db, now, requested.get('budgetMinutes', PRERENDER_BUDGET_MINUTES),
+                               bool(requested.get('force')), on_episode=renew)
+        last = {**result, 'startedAt': now, 'finishedAt': datetime.utcnow()}
+    except Exception as e:
+        result = None
+        last = {'error': str(e), 'startedAt': now, 'finishedAt': datetime.utcnow()}
+    db.prerenderRuns.update_one({'_id': RUNS_ID}, {'$set': {'leaseUntil': None, 'lastRun': last}})
+    return result
+
+def ensure_runner(db, interval=PRERENDER_INTERVAL_SECONDS):
+    """Start the background pre-render runner for this process if it is not running"""
+    global _runner
+    with _runner_lock:
+        if _runner is None or not _runner.is_alive():
+            _runner = threading.Thread(target=_run_forever, args=(db, interval), name='prerender-runner', daemon=True)
+            _runner.start()
+    return _runner
+
+def _run_forever(db, interval):
+    while True:
+        # Cleared first, so a request made during the pass is not lost
+        _wake.clear()
+        try:
+            run_pass(db)
+        except Exception as e:
+            print(f"Pre-render pass failed: {e}")
+        _wake.wait(interval)
+
+def demand_shift_report(db, days=7, now=None):
+    """How much bedtime rendering the pre-renders moved off-peak"""
+    now = now or datetime.utcnow()
+    since = now - timedelta(days=days)
+    rendered_hours = Counter()
+    on_demand_hours = Counter()
+    played = 0
+    unplayed = 0
+    shifted_seconds = 0.0
+    wasted_seconds = 0.0
+    lead_hours = []
+
+    for episode in db.podcastEpisodes.find({'audio.generatedAt': {'$gte': since}}, {'audio': 1}):
+        audio = episode['audio']
+        if not audio.get('prerendered'):
+            on_demand_hours[audio['generatedAt'].hour] += 1
+            continue
+        rendered_hours[audio['generatedAt'].hour] += 1
+        first_play = db.analytics.find_one(
+            {'episodeId': episode['_id'], 'type': {'$in': PLAY_EVENTS}, 'timestamp': {'$gte': audio['generatedAt']}},
+            sort=[('timestamp', 1)]
+        )
+        if first_play:
+            played += 1
+            shifted_seconds += audio.get('seconds', 0)
+            lead_hours.append((first_play['timestamp'] - audio['generatedAt']).total_seconds() / 3600)
+        else:
+            unplayed += 1
+            wasted_seconds += audio.get('seconds', 0)
+
+    prerendered = played + unplayed
+    return {
+        'days': days,
+        'prerendered': prerendered,
+        'played': played,
+        'hitRate': round(played / prerendered, 3) if prerendered else 0.0,
+        'shiftedMinutes': round(shifted_seconds / 60, 1),
+        'wastedMinutes': round(wasted_seconds / 60, 1),
+        'medianLeadHours': round(sorted(lead_hours)[len(lead_hours) // 2], 1) if lead_hours else None,
+        'prerendersByHour': {str(hour): count for hour, count in sorted(rendered_hours.items())},
+        'onDemandRendersByHour': {str(hour): count for hour, count in sorted(on_demand_hours.items())}
+    }
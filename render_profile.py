@@ -0,0 +1,81 @@
+"""
+Per-stage and per-chunk profile of one voice render.
+
+Pass a RenderProfile wherever the pipeline takes `timings` (or as
+`profile` to createVoiceOver / generate_audio_from_text) and it collects,
+for every stage, wall time, number of entries, bytes produced and the
+process's peak RSS, and for every chunk the provider that served it, wall
+time and bytes. report() returns the whole thing as a JSON-ready dict.
+
+Peak RSS is the process high-water mark (getrusage), so rssGrowthMb is how
+much a stage pushed that mark up, not memory freed again inside it.
+"""
+
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+def peakRssMb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+class RenderProfile:
+    def __init__(self, **metadata):
+        self.metadata = metadata
+        self.stages = {}
+        self.chunks = []
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'bytes': 0, 'peakRssMb': 0.0, 'rssGrowthMb': 0.0})
+
+    @contextmanager
+    def stage(self, name):
+        startRss = peakRssMb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            endRss = peakRssMb()
+            with self._lock:
+                stage = self._stage(name)
+                stage['seconds'] += elapsed
+                stage['calls'] += 1
+                stage['peakRssMb'] = max(stage['peakRssMb'], endRss)
+                stage['rssGrowthMb'] = round(stage['rssGrowthMb'] + endRss - startRss, 1)
+
+    def addBytes(self, name, count):
+        with self._lock:
+            self._stage(name)['bytes'] += count
+
+    def addChunk(self, index, **fields):
+        with self._lock:
+            self.chunks.append({'index': index, **fields})
+
+    def finish(self, **metadata):
+        self.metadata.update(metadata)
+        self.finished = time.perf_counter()
+
+    def report(self):
+        with self._lock:
+            end = self.finished or time.perf_counter()
+            chunks = sorted(self.chunks, key=lambda chunk: chunk['index'])
+            return {
+                **self.metadata,
+                'wallSeconds': round(end - self.started, 4),
+                'peakRssMb': peakRssMb(),
+                'stages': {
+                    name: {**stage, 'seconds': round(stage['seconds'], 4)}
+                    for name, stage in self.stages.items()
+                },
+                'chunks': [
+                    {key: round(value, 4) if isinstance(value, float) else value for key, value in chunk.items()}
+                    for chunk in chunks
+                ],
+            }
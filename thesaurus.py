@@ -2,6 +2,11 @@ import nltk
 # nltk.download('wordnet')
 from nltk.corpus import wordnet
 import random
+import hashlib
+import mmap
+import os
+import re
+import threading
 
 def getAnt(word):
     antonyms = []
@@ -22,3 +27,125 @@ def getSyn(word):
     if(len(synonyms) > 0):
         return synonyms[random.randint(0,len(synonyms)-1)]
     return word
+
+
+# Precompiled index
+#
+# WordNet is walked once and written to a sorted text file with one line per
+# lemma: "word<TAB>syn|syn|...<TAB>ant|ant|...". Lookups binary-search the
+# memory-mapped file, so nothing is parsed up front and the pages are shared
+# between processes.
+
+INDEX_PATH = os.getenv('NAPCAST_THESAURUS_INDEX', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thesaurus.idx'))
+
+# WordNet's own suffix rules (as used by morphy) to map inflected words onto
+# indexed lemmas
+MORPHOLOGICAL_SUBSTITUTIONS = [
+    ('s', ''), ('ses', 's'), ('ves', 'f'), ('xes', 'x'), ('zes', 'z'), ('ches', 'ch'), ('shes', 'sh'),
+    ('men', 'man'), ('ies', 'y'), ('es', 'e'), ('es', ''), ('ed', 'e'), ('ed', ''), ('ing', 'e'), ('ing', ''),
+    ('er', ''), ('est', ''), ('er', 'e'), ('est', 'e'),
+]
+
+def buildIndex(path=INDEX_PATH):
+    """Write the synonym/antonym index for every WordNet lemma."""
+    entries = {}
+    for word in wordnet.all_lemma_names():
+        synonyms = []
+        antonyms = []
+        for syn in wordnet.synsets(word):
+            for l in syn.lemmas():
+                if l.name() not in synonyms:
+                    synonyms.append(l.name())
+                if l.antonyms() and l.antonyms()[0].name() not in antonyms:
+                    antonyms.append(l.antonyms()[0].name())
+        if synonyms:
+            entries[word.lower().encode('utf-8')] = (synonyms, antonyms)
+
+    tmpPath = f'{path}.{os.getpid()}.tmp'
+    with open(tmpPath, 'wb') as f:
+        for key in sorted(entries):
+            synonyms, antonyms = entries[key]
+            f.write(key + b'\t' + '|'.join(synonyms).encode('utf-8') + b'\t' + '|'.join(antonyms).encode('utf-8') + b'\n')
+    os.replace(tmpPath, path)
+    return path
+
+class ThesaurusIndex:
+    def __init__(self, path=INDEX_PATH):
+        if not os.path.exists(path):
+            buildIndex(path)
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _find(self, key):
+        # Binary search over line starts in the sorted file
+        data = self.data
+        lo, hi = 0, len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = data.rfind(b'\n', 0, mid) + 1
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = len(data)
+            tab = data.find(b'\t', start, end)
+            word = data[start:tab]
+            if word == key:
+                return data[tab + 1:end].split(b'\t')
+            if word < key:
+                lo = end + 1
+            else:
+                hi = start
+        return None
+
+    def lookup(self, word):
+        """(synonyms, antonyms) for a word or one of its base forms."""
+        word = word.lower()
+        candidates = [word] + [word[:-len(old)] + new for old, new in MORPHOLOGICAL_SUBSTITUTIONS
+                               if word.endswith(old) and len(word) > len(old)]
+        # running -> runn -> run
+        candidates += [c[:-1] for c in candidates[1:] if len(c) > 2 and c[-1] == c[-2]]
+        for candidate in candidates:
+            fields = self._find(candidate.encode('utf-8'))
+            if fields is not None:
+                synonyms = fields[0].decode('utf-8').split('|') if fields[0] else []
+                antonyms = fields[1].decode('utf-8').split('|') if len(fields) > 1 and fields[1] else []
+                return synonyms, antonyms
+        return [], []
+
+_index = None
+_indexLock = threading.Lock()
+
+def getIndex():
+    global _index
+    with _indexLock:
+        if _index is None:
+            _index = ThesaurusIndex()
+        return _index
+
+def _pick(options, seed, word):
+    # Stable choice per (seed, word): the same word always gets the same
+    # replacement for a given seed, in every document and every process.
+    digest = hashlib.blake2b(f'{seed}\0{word}'.encode('utf-8'), digest_size=8).digest()
+    return options[int.from_bytes(digest, 'big') % len(options)]
+
+def transform(text, seed=0, antonyms=False):
+    """Replace every word with a synonym (or antonym) from the index."""
+    index = getIndex()
+    memo = {}
+    output = []
+    for word in re.findall(r'\w+', text):
+        replacement = memo.get(word)
+        if replacement is None:
+            synonyms, opposites = index.lookup(word)
+            options = opposites if antonyms else synonyms
+            replacement = _pick(options, seed, word.lower()).replace('_', ' ') if options else word
+            memo[word] = replacement
+        output.append(replacement)
+    return ' '.join(output)
+
+def transformMany(texts, seed=0, antonyms=False):
+    return [transform(text, seed, antonyms) for text in texts]
+
+if __name__ == "__main__":
+    import sys
+    print(f"Thesaurus index written to {buildIndex(sys.argv[1] if len(sys.argv) > 1 else INDEX_PATH)}")
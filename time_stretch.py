@@ -0,0 +1,138 @@
+"""
+Pitch-preserving time stretch (WSOLA) for NapCast voice modes.
+
+WSOLA cuts the input into overlapping windowed frames, reads them at
+`rate` times the speed they are written and, for each frame, searches a
+small tolerance window for the offset that best lines up with the previous
+frame's natural continuation. Duration changes, pitch does not.
+
+WsolaStretcher works on blocks, so audio can be fed in pieces of any size
+and only about one frame of input and output is buffered between calls.
+The per-frame work (windowing, cross-correlation, overlap-add) is done with
+NumPy.
+"""
+
+import numpy as np
+
+class WsolaStretcher:
+    def __init__(self, rate, sampleRate, channels=1, frameMs=30, toleranceMs=8):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.channels = channels
+        self.frameLength = max(4, int(sampleRate * frameMs / 1000) // 2 * 2)
+        self.synthesisHop = self.frameLength // 2
+        self.analysisHop = self.synthesisHop * self.rate
+        self.tolerance = int(sampleRate * toleranceMs / 1000)
+
+        n = np.arange(self.frameLength)
+        # Periodic Hann windows at 50% overlap sum to exactly one
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * n / self.frameLength))[:, None]
+        # The first frame has nothing to overlap with, so it does not fade in
+        self.firstWindow = self.window.copy()
+        self.firstWindow[:self.synthesisHop] = 1.0
+
+        self._input = np.zeros((0, channels))
+        self._inputStart = 0           # absolute index of self._input[0]
+        self._inputTotal = 0
+        self._pending = np.zeros((self.frameLength, channels))
+        self._frame = 0
+        self._previous = None          # input position of the last frame used
+        self._emitted = 0
+
+    def _available(self, start, end):
+        return start >= self._inputStart and end <= self._inputStart + len(self._input)
+
+    def _slice(self, start, end):
+        return self._input[start - self._inputStart:end - self._inputStart]
+
+    def _nextFrame(self):
+        # Returns the finished output hop for one frame, or None if more
+        # input is needed first.
+        N, Hs, tol = self.frameLength, self.synthesisHop, self.tolerance
+        nominal = int(round(self._frame * self.analysisHop))
+
+        if self._previous is None:
+            position = nominal
+            if not self._available(position, position + N):
+                return None
+            window = self.firstWindow
+        else:
+            natural = self._previous + Hs
+            searchStart = max(nominal - tol, self._inputStart)
+            searchEnd = nominal + tol + N
+            if not self._available(searchStart, searchEnd) or not self._available(natural, natural + N):
+                return None
+            # Align on the channel mix; the chosen offset applies to all channels
+            template = self._slice(natural, natural + N).sum(axis=1)
+            region = self._slice(searchStart, searchEnd).sum(axis=1)
+            scores = np.correlate(region, template, mode='valid')
+            position = searchStart + int(np.argmax(scores))
+            window = self.window
+
+        self._pending += self._slice(position, position + N) * window
+        hop = self._pending[:Hs].copy()
+        self._pending = np.concatenate([self._pending[Hs:], np.zeros((Hs, self.channels))])
+        self._previous = position
+        self._frame += 1
+
+        # Drop input that no later frame can reach
+        keepFrom = min(int(round(self._frame * self.analysisHop)) - tol, position + Hs)
+        if keepFrom > self._inputStart:
+            self._input = self._input[keepFrom - self._inputStart:]
+            self._inputStart = keepFrom
+        return hop
+
+    def _drain(self):
+        hops = []
+        while True:
+            hop = self._nextFrame()
+            if hop is None:
+                break
+            hops.append(hop)
+        if not hops:
+            return np.zeros((0, self.channels))
+        output = np.concatenate(hops)
+        self._emitted += len(output)
+        return output
+
+    def process(self, block):
+        """Feed a (frames, channels) float block and return the output ready so far."""
+        block = np.asarray(block, dtype=np.float64).reshape(-1, self.channels)
+        self._inputTotal += len(block)
+        self._input = np.concatenate([self._input, block])
+        return self._drain()
+
+    def flush(self):
+        """Finish the stream and return the remaining output."""
+        expected = int(round(self._inputTotal / self.rate))
+        padding = np.zeros((self.frameLength + self.tolerance + int(self.analysisHop) + 1, self.channels))
+        tail = []
+        while self._emitted < expected:
+            self._input = np.concatenate([self._input, padding])
+            tail.append(self._drain())
+        output = np.concatenate(tail) if tail else np.zeros((0, self.channels))
+        excess = self._emitted - expected
+        if excess > 0:
+            output = output[:len(output) - excess]
+            self._emitted = expected
+        return output
+
+def stretchSamples(samples, rate, sampleRate, blockSize=65536):
+    """Stretch a (frames, channels) array, block by block."""
+    samples = np.asarray(samples)
+    stretcher = WsolaStretcher(rate, sampleRate, samples.shape[1] if samples.ndim > 1 else 1)
+    pieces = [stretcher.process(samples[i:i + blockSize]) for i in range(0, len(samples), blockSize)]
+    pieces.append(stretcher.flush())
+    return np.concatenate(pieces)
+
+def stretchSegment(sound, rate):
+    """Pitch-preserving speed change for a pydub AudioSegment."""
+    if rate == 1:
+        return sound
+    dtype = {1: np.int8, 2: np.int16, 4: np.int32}[sound.sample_width]
+    samples = np.frombuffer(sound.raw_data, dtype=dtype).reshape(-1, sound.channels)
+    stretched = stretchSamples(samples, rate, sound.frame_rate)
+    limits = np.iinfo(dtype)
+    raw = np.clip(np.rint(stretched), limits.min, limits.max).astype(dtype).tobytes()
+    return sound._spawn(raw)
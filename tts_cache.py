@@ -0,0 +1,143 @@
+"""
+Content-addressed on-disk cache for synthesized TTS chunks.
+
+Entries are keyed by provider, voice model, rate and a hash of the
+normalized chunk text, and stored as <directory>/<key[:2]>/<key>.mp3.
+Writes go through a temporary file and os.replace, so concurrent writers in
+threads or processes never expose a partial file. When the cache grows past
+maxBytes the least recently used entries are removed.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import unicodedata
+
+DEFAULT_CACHE_DIR = os.getenv('NAPCAST_TTS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'napcast_tts_cache'))
+DEFAULT_CACHE_MB = int(os.getenv('NAPCAST_TTS_CACHE_MB', '512'))
+
+def normalizeText(text):
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+def contentKey(provider, model, rate, text, variant=''):
+    """Key for audio rendered from text with the given provider settings."""
+    digest = hashlib.sha256(normalizeText(text).encode('utf-8')).hexdigest()
+    return hashlib.sha256(f'{provider}\0{model}\0{float(rate)}\0{variant}\0{digest}'.encode('utf-8')).hexdigest()
+
+class ChunkCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, maxBytes=DEFAULT_CACHE_MB * 1024 * 1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, provider, model, rate, text):
+        return contentKey(provider, model, rate, text)
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.mp3')
+
+    def fetch(self, key, destination):
+        """Copy a cached chunk to destination. Returns True on a hit."""
+        path = self.path(key)
+        try:
+            shutil.copyfile(path, destination)
+            os.utime(path)  # mtime doubles as the LRU timestamp
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, source):
+        """Add a synthesized chunk file to the cache."""
+        if not os.path.exists(source) or os.path.getsize(source) == 0:
+            return False
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out, open(source, 'rb') as src:
+                shutil.copyfileobj(src, out)
+            os.replace(tmpPath, path)
+        except Exception:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+
+        with self._lock:
+            self.stores += 1
+            if self._size is not None:
+                self._size += os.path.getsize(path)
+            overLimit = self._size is None or self._size > self.maxBytes
+        if overLimit:
+            self.evict()
+        return True
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.mp3'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue  # removed by another process
+                entries.append((info.st_mtime, info.st_size, path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in maxBytes."""
+        with self._lock:
+            entries = self._entries()
+            size = sum(entry[1] for entry in entries)
+            if size > self.maxBytes:
+                entries.sort()
+                for _, entrySize, path in entries:
+                    if size <= self.maxBytes:
+                        break
+                    try:
+                        os.remove(path)
+                        self.evictions += 1
+                    except FileNotFoundError:
+                        pass
+                    size -= entrySize
+            self._size = size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'directory': self.directory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'bytes': self._size,
+                'maxBytes': self.maxBytes,
+            }
+
+_defaultCache = None
+_defaultCacheLock = threading.Lock()
+
+def getChunkCache():
+    """Process-wide cache, or None when NAPCAST_TTS_CACHE=0."""
+    global _defaultCache
+    if os.getenv('NAPCAST_TTS_CACHE', '1') == '0':
+        return None
+    with _defaultCacheLock:
+        if _defaultCache is None:
+            _defaultCache = ChunkCache()
+        return _defaultCache
@@ -0,0 +1,224 @@
+"""
+Hedged requests and tiered failover for TTS chunk synthesis.
+
+For each chunk the FailoverRouter walks a chain of provider tiers, by
+default deepgram -> gtts -> pyttsx3:
+
+- every tier sits behind a circuit breaker; after `failureThreshold`
+  consecutive failed chunks it opens and the tier is skipped until
+  `resetTimeout` seconds have passed, when a single probe is let through,
+- a call that is still running after the tier's latency percentile (p95 of
+  recent successful calls by default) gets one hedged duplicate; whichever
+  finishes first wins and the other result is discarded. Hedges are capped
+  at `hedgeBudget` of all calls so a slow provider is not sent twice the
+  load.
+
+stats() reports which tier served how many chunks, along with failures,
+hedges and breaker state. NAPCAST_TTS_FAILOVER=0 turns the fallback tiers
+off and NAPCAST_TTS_HEDGE_PERCENTILE=0 turns hedging off.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+FAILOVER_TIERS = {
+    'deepgram': ['gtts', 'pyttsx3'],
+    'gtts': ['pyttsx3'],
+}
+HEDGE_PERCENTILE = float(os.getenv('NAPCAST_TTS_HEDGE_PERCENTILE', '95'))
+
+class CircuitBreaker:
+    def __init__(self, failureThreshold=5, resetTimeout=30.0):
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.failures = 0
+        self.openedAt = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.openedAt is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.openedAt >= self.resetTimeout else 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.openedAt = None
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failureThreshold:
+                self.openedAt = time.monotonic()
+            self.probing = False
+
+class LatencyWindow:
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percent, minSamples):
+        with self.lock:
+            if len(self.samples) < minSamples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+class FailoverRouter:
+    def __init__(self, tiers=FAILOVER_TIERS, hedgePercentile=HEDGE_PERCENTILE, minSamples=20, hedgeBudget=0.1,
+                 failureThreshold=5, resetTimeout=30.0, maxWorkers=32):
+        self.tiers = tiers
+        self.hedgePercentile = hedgePercentile
+        self.minSamples = minSamples
+        self.hedgeBudget = hedgeBudget
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix='tts-hedge')
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def _provider(self, name):
+        with self._lock:
+            state = self._providers.get(name)
+            if state is None:
+                state = {
+                    'breaker': CircuitBreaker(self.failureThreshold, self.resetTimeout),
+                    'latency': LatencyWindow(),
+                    'calls': 0,
+                    'served': 0,
+                    'failures': 0,
+                    'skipped': 0,
+                    'hedges': 0,
+                    'hedgeWins': 0,
+                }
+                self._providers[name] = state
+            return state
+
+    def _count(self, state, field):
+        with self._lock:
+            state[field] += 1
+
+    def chain(self, provider):
+        return [provider] + list(self.tiers.get(provider, []))
+
+    def run(self, provider, call, destination):
+        """Synthesize one chunk into <destination>.mp3.
+
+        call(providerName, fileName) must write <fileName>.mp3 and return
+        True on success. Returns the name of the provider that served the
+        chunk, or None when every tier failed or was unavailable.
+        """
+        for name in self.chain(provider):
+            state = self._provider(name)
+            if not state['breaker'].allow():
+                self._count(state, 'skipped')
+                continue
+            if self._attempt(name, state, call, destination):
+                state['breaker'].success()
+                self._count(state, 'served')
+                return name
+            state['breaker'].failure()
+            self._count(state, 'failures')
+        return None
+
+    def _hedgeDelay(self, state):
+        if not self.hedgePercentile:
+            return None
+        with self._lock:
+            if state['hedges'] >= self.hedgeBudget * max(state['calls'], 1):
+                return None
+        return state['latency'].percentile(self.hedgePercentile, self.minSamples)
+
+    def _attempt(self, name, state, call, destination):
+        attempts = {}
+
+        def launch(index):
+            fileName = f'{destination}_{name}{index}'
+            started = time.monotonic()
+            self._count(state, 'calls')
+            future = self.executor.submit(call, name, fileName)
+            attempts[future] = (index, fileName, started)
+            return future
+
+        pending = {launch(0)}
+        delay = self._hedgeDelay(state)
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # Still running past the latency percentile: send a duplicate
+                self._count(state, 'hedges')
+                pending.add(launch(1))
+                delay = None
+                continue
+            for future in done:
+                if winner is None and future.exception() is None and future.result():
+                    winner = future
+
+        # Failed and losing calls leave nothing behind. A call still running
+        # cannot be cancelled, so its output is dropped once it ends.
+        for future, (_, fileName, _) in attempts.items():
+            if future is not winner:
+                future.add_done_callback(lambda _, path=f'{fileName}.mp3': _remove(path))
+        if winner is None:
+            return False
+
+        index, fileName, started = attempts[winner]
+        state['latency'].add(time.monotonic() - started)
+        if index > 0:
+            self._count(state, 'hedgeWins')
+        os.replace(f'{fileName}.mp3', f'{destination}.mp3')
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'served': state['served'],
+                    'calls': state['calls'],
+                    'failures': state['failures'],
+                    'skipped': state['skipped'],
+                    'hedges': state['hedges'],
+                    'hedgeWins': state['hedgeWins'],
+                    'breaker': state['breaker'].state,
+                    'latencyPercentile': state['latency'].percentile(self.hedgePercentile or 95, 1),
+                }
+                for name, state in self._providers.items()
+            }
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+_router = None
+_routerLock = threading.Lock()
+
+def getFailover():
+    global _router
+    with _routerLock:
+        if _router is None:
+            tiers = FAILOVER_TIERS if os.getenv('NAPCAST_TTS_FAILOVER', '1') != '0' else {}
+            _router = FailoverRouter(tiers)
+        return _router
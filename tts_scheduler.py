@@ -0,0 +1,158 @@
+"""
+Process-wide scheduler for TTS provider calls.
+
+Every render in the process goes through the same ProviderScheduler, so
+the provider's limits are shared instead of each job hammering it on its
+own. Per provider there is:
+
+- a token bucket that caps the request rate (requests/second plus burst),
+- an AIMD concurrency limit: it grows by about one slot per window of
+  successful calls and is cut multiplicatively when the provider throttles
+  (HTTP 429) or a call takes longer than the target latency.
+
+Limits come from PROVIDER_LIMITS and can be overridden with a JSON object
+in NAPCAST_TTS_LIMITS, e.g. {"deepgram": {"rate": 20, "maxConcurrency": 32}}.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PROVIDER_LIMITS = {
+    'deepgram': {'rate': 10.0, 'burst': 20, 'minConcurrency': 1, 'maxConcurrency': 16, 'targetLatency': 15.0},
+    'gtts': {'rate': 2.0, 'burst': 4, 'minConcurrency': 1, 'maxConcurrency': 4, 'targetLatency': 15.0},
+    'pyttsx3': {'rate': None, 'burst': 1, 'minConcurrency': 1, 'maxConcurrency': 1, 'targetLatency': None},
+}
+DEFAULT_LIMITS = {'rate': None, 'burst': 1, 'minConcurrency': 1, 'maxConcurrency': 64, 'targetLatency': None}
+
+class ProviderThrottled(Exception):
+    """Raised by a provider when it is asked to slow down."""
+
+def isThrottle(error):
+    return isinstance(error, ProviderThrottled) or getattr(error, 'status', None) == 429
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveLimiter:
+    def __init__(self, minimum, maximum, targetLatency=None, increase=1.0, decrease=0.5, latencyDecrease=0.8):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.targetLatency = targetLatency
+        self.increase = increase
+        self.decrease = decrease
+        self.latencyDecrease = latencyDecrease
+        self.limit = float(max(minimum, min(maximum, 4)))
+        self.inFlight = 0
+        self.lastDecrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.inFlight >= int(self.limit):
+                self.condition.wait()
+            self.inFlight += 1
+
+    def release(self, started, latency=None, throttled=False):
+        with self.condition:
+            self.inFlight -= 1
+            # Calls that were already in flight at the last cut report the
+            # same congestion; only cut once per window.
+            congested = throttled or (self.targetLatency and latency is not None and latency > self.targetLatency)
+            if congested and started > self.lastDecrease:
+                self.limit = max(self.minimum, self.limit * (self.decrease if throttled else self.latencyDecrease))
+                self.lastDecrease = time.monotonic()
+            elif not congested and latency is not None:
+                # +increase per full window of successful calls
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self.condition.notify_all()
+
+class ProviderScheduler:
+    def __init__(self, limits=None):
+        self.limits = {name: dict(values) for name, values in PROVIDER_LIMITS.items()}
+        for name, values in (limits or {}).items():
+            self.limits.setdefault(name, dict(DEFAULT_LIMITS)).update(values)
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def _provider(self, name):
+        with self._lock:
+            state = self._providers.get(name)
+            if state is None:
+                config = dict(DEFAULT_LIMITS)
+                config.update(self.limits.get(name, {}))
+                state = {
+                    'bucket': TokenBucket(config['rate'], config['burst']),
+                    'limiter': AdaptiveLimiter(config['minConcurrency'], config['maxConcurrency'], config['targetLatency']),
+                    'calls': 0,
+                    'throttles': 0,
+                    'errors': 0,
+                }
+                self._providers[name] = state
+            return state
+
+    @contextmanager
+    def slot(self, provider):
+        """Hold a concurrency slot and a rate token for one provider call."""
+        state = self._provider(provider)
+        state['limiter'].acquire()
+        start = time.monotonic()
+        try:
+            state['bucket'].acquire()
+            start = time.monotonic()
+            yield
+        except Exception as e:
+            throttled = isThrottle(e)
+            with self._lock:
+                state['throttles' if throttled else 'errors'] += 1
+            state['limiter'].release(start, throttled=throttled)
+            raise
+        else:
+            with self._lock:
+                state['calls'] += 1
+            state['limiter'].release(start, latency=time.monotonic() - start)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'concurrencyLimit': round(state['limiter'].limit, 2),
+                    'inFlight': state['limiter'].inFlight,
+                    'calls': state['calls'],
+                    'throttles': state['throttles'],
+                    'errors': state['errors'],
+                }
+                for name, state in self._providers.items()
+            }
+
+_scheduler = None
+_schedulerLock = threading.Lock()
+
+def getScheduler():
+    global _scheduler
+    with _schedulerLock:
+        if _scheduler is None:
+            overrides = json.loads(os.getenv('NAPCAST_TTS_LIMITS', '{}') or '{}')
+            _scheduler = ProviderScheduler(overrides)
+        return _scheduler
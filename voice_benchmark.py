@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the NapCast voice pipeline.
+Run `python3 voice_benchmark.py <benchmark> --help` for the options of each benchmark.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import voice_generator as vg
+
+SAMPLE_PARAGRAPH = (
+    "The committee reviewed the quarterly inventory of paper clips in great detail. "
+    "Each box was counted twice, and the totals were written on a yellow notepad. "
+    "Nobody could remember why the blue clips were stored apart from the silver ones! "
+    "After a short break for tea, the counting resumed at a slow and steady pace. "
+    "Dr. Smith noted that the figures matched last year's numbers almost exactly? "
+)
+
+def makeScript(size):
+    # Repeat a plain paragraph until the script is `size` characters long
+    repeats = size // len(SAMPLE_PARAGRAPH) + 1
+    return (SAMPLE_PARAGRAPH * repeats)[:size]
+
+def legacyBuildSentence(text, charLimit):
+    # The recursive chunker that iterChunks replaced, kept for comparison
+    from nltk.tokenize import RegexpTokenizer
+
+    tokenized = list(vg._getTokenizer('sentence').tokenize(text))
+    if(len(tokenized[0]) > charLimit):
+        tokenized = RegexpTokenizer(r'\w+').tokenize(text)
+        query = ""
+        rest = ""
+        stop = False
+        for word in tokenized:
+            if stop == False and len(query)+len(word) <= charLimit:
+                query+=' '+word
+            else:
+                stop = True
+                rest+=' '+word
+        result = [query.strip()]
+        if(len(rest.strip())>0):
+            result += legacyBuildSentence(rest.strip(), charLimit)
+        return result
+    query = ""
+    rest = ""
+    stop = False
+    for sent in tokenized:
+        if stop == False and len(query)+len(sent) <= charLimit:
+            query+=sent
+        else:
+            stop = True
+            rest+=sent
+    result = [query]
+    if(len(rest)>0):
+        result += legacyBuildSentence(rest, charLimit)
+    return result
+
+def timeCall(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def benchChunker(args):
+    results = []
+    for size in args.sizes:
+        text = makeScript(size)
+        vg._getTokenizer('sentence')  # build the cached tokenizer outside the timed region
+        elapsed, chunks = timeCall(lambda: list(vg.iterChunks(text, args.char_limit, balance=args.balance)), args.repeat)
+        lengths = [len(c) for c in chunks]
+        row = {
+            'implementation': 'iterChunks',
+            'bytes': size,
+            'seconds': round(elapsed, 4),
+            'mb_per_second': round(size / elapsed / 1e6, 2) if elapsed else None,
+            'chunks': len(chunks),
+            'min_chunk': min(lengths),
+            'max_chunk': max(lengths),
+        }
+        results.append(row)
+
+        if size <= args.legacy_max:
+            limit = sys.getrecursionlimit()
+            sys.setrecursionlimit(max(limit, 10 * len(chunks) + 1000))
+            try:
+                elapsed, chunks = timeCall(lambda: legacyBuildSentence(text, args.char_limit), args.repeat)
+            finally:
+                sys.setrecursionlimit(limit)
+            results.append({
+                'implementation': 'legacy',
+                'bytes': size,
+                'seconds': round(elapsed, 4),
+                'mb_per_second': round(size / elapsed / 1e6, 2) if elapsed else None,
+                'chunks': len(chunks),
+            })
+    return results
+
+def makeChunkFiles(directory, count, seconds):
+    # Speech-like chunk MP3s: a tone per chunk, encoded the way providers ship them
+    from pydub.generators import Sine
+
+    files = []
+    for i in range(count):
+        tone = Sine(180 + 20 * (i % 8), sample_rate=24000).to_audio_segment(duration=seconds * 1000, volume=-20)
+        path = os.path.join(directory, f'chunk{i}.mp3')
+        tone.set_channels(1).export(path, format='mp3', bitrate='48k')
+        files.append(path)
+    return files
+
+def benchAssembly(args):
+    results = []
+    workdir = tempfile.mkdtemp(prefix='napcast_bench_')
+    try:
+        files = makeChunkFiles(workdir, args.chunks, args.chunk_seconds)
+        for engine in args.engines:
+            output = os.path.join(workdir, f'out_{engine}.mp3')
+            elapsed, _ = timeCall(lambda: vg.ASSEMBLY_ENGINES[engine](files, output, args.rate, preservePitch=args.preserve_pitch), args.repeat)
+            results.append({
+                'engine': engine,
+                'chunks': args.chunks,
+                'audio_seconds': args.chunks * args.chunk_seconds,
+                'rate': args.rate,
+                'preserve_pitch': args.preserve_pitch,
+                'seconds': round(elapsed, 4),
+                'output_bytes': os.path.getsize(output),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def runPipelineCase(size, voiceMode, engine, workers):
+    # One organizeSpeech render against the synthetic provider. Runs in its own process so peak RSS belongs to this case only.
+    os.environ['NAPCAST_TTS_PROVIDER'] = 'synthetic'
+    os.environ['NAPCAST_TTS_CACHE'] = '0'
+    ttsMode, voice, rate = vg.voiceModeSettings(voiceMode)
+    text = makeScript(size)
+    timings = {}
+
+    with vg.renderWorkspace('napcast_bench_') as workdir:
+        output = os.path.join(workdir, 'bench.mp3')
+        start = time.perf_counter()
+        vg.organizeSpeech(text, ttsMode, voice, 'bench', rate, workers, engine, timings, output, voiceMode in vg.PITCH_PRESERVING_MODES)
+        wall = time.perf_counter() - start
+        outputBytes = os.path.getsize(output)
+
+    audioSeconds = len(text) / vg.SYNTHETIC_CHARS_PER_SECOND / rate
+    return {
+        'size': size,
+        'voice_mode': voiceMode,
+        'engine': engine,
+        'workers': workers,
+        'wall_seconds': round(wall, 4),
+        'stages': {stage: round(seconds, 4) for stage, seconds in timings.items()},
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'chars_per_second': round(len(text) / wall, 1),
+        'audio_seconds_per_second': round(audioSeconds / wall, 2),
+        'output_bytes': outputBytes,
+    }
+
+def benchPipelineCase(args):
+    return [runPipelineCase(args.size, args.voice_mode, args.engine, args.workers)]
+
+def runPipelineSubprocess(size, voiceMode, engine, workers):
+    command = [
+        sys.executable, os.path.abspath(__file__), 'pipeline-case',
+        '--size', str(size), '--voice-mode', str(voiceMode),
+        '--engine', engine, '--workers', str(workers),
+    ]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'size': size, 'voice_mode': voiceMode, 'engine': engine, 'error': completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def benchPipeline(args):
+    results = []
+    for size in args.sizes:
+        for voiceMode in args.voice_modes:
+            results.append(runPipelineSubprocess(size, voiceMode, args.engine, args.workers))
+    return results
+
+def benchLongEpisode(args):
+    # Peak RSS against episode length. A constant-memory engine stays flat
+    # from the first hour to the last.
+    _, _, rate = vg.voiceModeSettings(args.voice_mode)
+    results = []
+    for engine in args.engines:
+        for hours in args.hours:
+            size = int(hours * 3600 * vg.SYNTHETIC_CHARS_PER_SECOND * rate)
+            row = runPipelineSubprocess(size, args.voice_mode, engine, args.workers)
+            row['hours'] = hours
+            results.append(row)
+    return results
+
+class DeepgramStandIn(ThreadingHTTPServer):
+    """Local HTTP server that answers POST /v1/speak like Deepgram does.
+
+    Latency is `latency` seconds plus `perChar` per character of text, and a
+    `failRate` fraction of requests is throttled with a 429. The body is
+    fake MP3 data sized like a 48 kbit/s rendering of the text.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.05, perChar=0.0, failRate=0.0):
+        self.latency = latency
+        self.perChar = perChar
+        self.failRate = failRate
+        self.connections = 0
+        self.requests = 0
+        self.throttled = 0
+        self.counterLock = threading.Lock()
+        super().__init__(('127.0.0.1', port), DeepgramStandInHandler)
+
+    @property
+    def baseUrl(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class DeepgramStandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def setup(self):
+        super().setup()
+        with self.server.counterLock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        text = json.loads(body or b'{}').get('text', '')
+        with self.server.counterLock:
+            self.server.requests += 1
+            throttle = random.random() < self.server.failRate
+            if throttle:
+                self.server.throttled += 1
+        time.sleep(self.server.latency + self.server.perChar * len(text))
+        if throttle:
+            payload = b'{"err_code": "TOO_MANY_REQUESTS"}'
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Retry-After', '0')
+        else:
+            seconds = max(len(text), 1) / vg.SYNTHETIC_CHARS_PER_SECOND
+            payload = b'\xff\xf3' * int(seconds * 3000)
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def benchDeepgram(args):
+    import deepgram_client
+
+    results = []
+    texts = [makeScript(args.chunk_chars)] * args.requests
+    for pooled in (False, True):
+        server = DeepgramStandIn(latency=args.latency, failRate=args.fail_rate).start()
+        shared = deepgram_client.DeepgramSpeakClient('stand-in', server.baseUrl, backoff=0.01)
+        latencies = []
+
+        def call(job):
+            index, text = job
+            # Unpooled mirrors the old code: a brand new client for every chunk
+            client = shared if pooled else deepgram_client.DeepgramSpeakClient('stand-in', server.baseUrl, backoff=0.01)
+            start = time.perf_counter()
+            client.speak(text, vg.DEEPGRAM_VOICES[0], os.path.join(workdir, f'chunk{index}.mp3'))
+            latencies.append(time.perf_counter() - start)
+            if not pooled:
+                client.close()
+
+        with vg.renderWorkspace('napcast_bench_') as workdir:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                list(pool.map(call, enumerate(texts)))
+            wall = time.perf_counter() - start
+        shared.close()
+        server.stop()
+
+        latencies.sort()
+        results.append({
+            'client': 'pooled' if pooled else 'per-call',
+            'requests': args.requests,
+            'workers': args.workers,
+            'wall_seconds': round(wall, 4),
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+            'connections_opened': server.connections,
+            'server_requests': server.requests,
+            'throttled': server.throttled,
+        })
+    return results
+
+def runDeepgramStandIn(args):
+    server = DeepgramStandIn(args.port, args.latency, args.per_char, args.fail_rate)
+    print(f"Deepgram stand-in listening on {server.baseUrl} (set DEEPGRAM_BASE_URL to use it)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return [{'requests': server.requests, 'connections': server.connections, 'throttled': server.throttled}]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the NapCast voice pipeline')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    chunker = subparsers.add_parser('chunker', help='Text chunking throughput')
+    chunker.add_argument('--sizes', type=int, nargs='+', default=[16_000, 128_000, 1_000_000], help='Script sizes in characters')
+    chunker.add_argument('--char-limit', type=int, default=2000, help='Maximum characters per chunk')
+    chunker.add_argument('--balance', action='store_true', help='Balance chunk lengths')
+    chunker.add_argument('--repeat', type=int, default=3, help='Runs per size, the best time is reported')
+    chunker.add_argument('--legacy-max', type=int, default=128_000, help='Largest size to also run through the legacy chunker')
+    chunker.set_defaults(func=benchChunker)
+
+    assembly = subparsers.add_parser('assembly', help='Chunk assembly engines')
+    assembly.add_argument('--engines', nargs='+', default=sorted(vg.ASSEMBLY_ENGINES), choices=sorted(vg.ASSEMBLY_ENGINES), help='Engines to compare')
+    assembly.add_argument('--chunks', type=int, default=40, help='Number of chunk files')
+    assembly.add_argument('--chunk-seconds', type=float, default=30, help='Duration of each chunk')
+    assembly.add_argument('--rate', type=float, default=0.8, help='Playback rate applied during assembly')
+    assembly.add_argument('--preserve-pitch', action='store_true', help='Use the WSOLA time stretch for the rate change')
+    assembly.add_argument('--repeat', type=int, default=1, help='Runs per engine, the best time is reported')
+    assembly.set_defaults(func=benchAssembly)
+
+    pipeline = subparsers.add_parser('pipeline', help='End-to-end organizeSpeech with the offline synthetic provider')
+    pipeline.add_argument('--sizes', type=int, nargs='+', default=[2_000, 20_000, 100_000], help='Script sizes in characters')
+    pipeline.add_argument('--voice-modes', type=int, nargs='+', default=[0, 2, 3], help='Voice modes to render')
+    pipeline.add_argument('--engine', default=vg.DEFAULT_ENGINE, choices=sorted(vg.ASSEMBLY_ENGINES), help='Audio assembly engine')
+    pipeline.add_argument('--workers', type=int, default=vg.DEFAULT_MAX_WORKERS, help='Concurrent chunk synthesis')
+    pipeline.set_defaults(func=benchPipeline)
+
+    longEpisode = subparsers.add_parser('long-episode', help='Peak memory of multi-hour renders with the offline synthetic provider')
+    longEpisode.add_argument('--hours', type=float, nargs='+', default=[1, 2, 4, 8], help='Episode lengths in hours of audio')
+    longEpisode.add_argument('--engines', nargs='+', default=['stream'], choices=sorted(vg.ASSEMBLY_ENGINES), help='Engines to compare')
+    longEpisode.add_argument('--voice-mode', type=int, default=3, help='Voice mode to render')
+    longEpisode.add_argument('--workers', type=int, default=vg.DEFAULT_MAX_WORKERS, help='Concurrent chunk synthesis')
+    longEpisode.set_defaults(func=benchLongEpisode)
+
+    pipelineCase = subparsers.add_parser('pipeline-case', help='A single pipeline run (used by the pipeline benchmark)')
+    pipelineCase.add_argument('--size', type=int, required=True)
+    pipelineCase.add_argument('--voice-mode', type=int, required=True)
+    pipelineCase.add_argument('--engine', default=vg.DEFAULT_ENGINE, choices=sorted(vg.ASSEMBLY_ENGINES))
+    pipelineCase.add_argument('--workers', type=int, default=vg.DEFAULT_MAX_WORKERS)
+    pipelineCase.set_defaults(func=benchPipelineCase)
+
+    deepgram = subparsers.add_parser('deepgram', help='Pooled vs per-call Deepgram client against a local stand-in')
+    deepgram.add_argument('--requests', type=int, default=200, help='Chunks to synthesize')
+    deepgram.add_argument('--workers', type=int, default=8, help='Concurrent requests')
+    deepgram.add_argument('--chunk-chars', type=int, default=2000, help='Characters per chunk')
+    deepgram.add_argument('--latency', type=float, default=0.02, help='Stand-in response latency in seconds')
+    deepgram.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    deepgram.set_defaults(func=benchDeepgram)
+
+    standIn = subparsers.add_parser('deepgram-standin', help='Run the local Deepgram stand-in server')
+    standIn.add_argument('--port', type=int, default=8765)
+    standIn.add_argument('--latency', type=float, default=0.05, help='Base response latency in seconds')
+    standIn.add_argument('--per-char', type=float, default=0.0, help='Extra latency per character of text')
+    standIn.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    standIn.set_defaults(func=runDeepgramStandIn)
+
+    args = parser.parse_args()
+    for row in args.func(args):
+        print(json.dumps(row))
+
+if __name__ == "__main__":
+    main()
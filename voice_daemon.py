@@ -0,0 +1,214 @@
+"""
+Long-lived voice worker daemon for NapCast.
+
+Keeps a pool of warm worker processes (interpreter, dotenv, nltk, pydub and
+the tokenizers already loaded) and accepts render jobs over a local Unix
+socket or over stdin/stdout. Both transports speak newline-delimited JSON:
+
+    request:  {"id": "...", "text": "..." | "text_file": "...", "output": "...",
+               "voice_mode": 0, "stupify": false, "engine": "stream",
+               "profile": false, "job_id": "...", "hls": "..."}
+    response: {"id": "...", "status": "success", "output": "...", "seconds": 1.2,
+               "profile": {...}, "hls": {...}}
+              {"id": "...", "status": "error", "message": "..."}
+
+With "profile" set the render is profiled and the render_profile report is
+returned with the response; "job_id" is recorded in it. With "hls" (a
+directory) the episode is also packaged as HLS there and the package
+summary is returned.
+
+A request of {"command": "ping"} answers {"status": "success", "message": "pong"}.
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import voice_generator as vg
+
+DEFAULT_SOCKET = os.getenv('NAPCAST_VOICE_SOCKET', '/tmp/napcast-voice.sock')
+DEFAULT_POOL_SIZE = int(os.getenv('NAPCAST_VOICE_POOL', str(max(1, (os.cpu_count() or 2) // 2))))
+
+def warmWorker():
+    # Pay the import and tokenizer costs once per worker, not once per job
+    import pydub  # noqa: F401
+    try:
+        vg._getTokenizer('sentence')
+        vg._getTokenizer('word')
+    except Exception as e:
+        print(f"Tokenizer warm-up failed: {e}", file=sys.stderr)
+    return os.getpid()
+
+def renderJob(job):
+    start = time.perf_counter()
+    text = job.get('text')
+    if text is None:
+        with open(job['text_file'], 'r', encoding='utf-8') as f:
+            text = f.read()
+    output = job['output']
+    profile = None
+    if job.get('profile'):
+        from render_profile import RenderProfile
+        profile = RenderProfile(jobId=job.get('job_id'), voiceMode=int(job.get('voice_mode', 0)),
+                                textFile=job.get('text_file'), output=output)
+    packaged = vg.createVoiceOver(
+        text,
+        int(job.get('voice_mode', 0)),
+        bool(job.get('stupify', False)),
+        int(job.get('workers', vg.DEFAULT_MAX_WORKERS)),
+        job.get('engine', vg.DEFAULT_ENGINE),
+        output,
+        profile,
+        job.get('hls'),
+    )
+    if not os.path.exists(output):
+        raise RuntimeError("Audio file was not generated")
+    response = {'status': 'success', 'output': output, 'seconds': round(time.perf_counter() - start, 3)}
+    if profile is not None:
+        response['profile'] = profile.report()
+    if packaged is not None:
+        response['hls'] = packaged
+    return response
+
+class VoiceDaemon:
+    def __init__(self, poolSize=DEFAULT_POOL_SIZE):
+        self.poolSize = poolSize
+        self.pool = ProcessPoolExecutor(max_workers=poolSize, initializer=warmWorker)
+        # Start every worker now so the first jobs do not pay for a cold start
+        for future in [self.pool.submit(warmWorker) for _ in range(poolSize)]:
+            future.result()
+
+    def submit(self, request, callback):
+        """Run one request and call callback(response) when it finishes."""
+        if not isinstance(request, dict):
+            callback({'status': 'error', 'message': 'Request must be a JSON object'})
+            return
+        requestId = request.get('id')
+        if request.get('command') == 'ping':
+            callback({'id': requestId, 'status': 'success', 'message': 'pong'})
+            return
+        if 'output' not in request or ('text' not in request and 'text_file' not in request):
+            callback({'id': requestId, 'status': 'error', 'message': 'output and text or text_file are required'})
+            return
+
+        def finished(future):
+            try:
+                response = future.result()
+            except Exception as e:
+                response = {'status': 'error', 'message': str(e)}
+            response['id'] = requestId
+            callback(response)
+
+        self.pool.submit(renderJob, request).add_done_callback(finished)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+    def serveStdio(self, stdin, stdout):
+        lock = threading.Lock()
+        pending = threading.Semaphore(0)
+        submitted = 0
+
+        def reply(response):
+            with lock:
+                stdout.write(json.dumps(response) + '\n')
+                stdout.flush()
+            pending.release()
+
+        for line in stdin:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                reply({'status': 'error', 'message': f'Invalid JSON: {e}'})
+            else:
+                self.submit(request, reply)
+            submitted += 1
+        # Answer everything that was read before exiting on EOF
+        for _ in range(submitted):
+            pending.acquire()
+
+    def serveSocket(self, path):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                lock = threading.Lock()
+                outstanding = []
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    done = threading.Event()
+                    outstanding.append(done)
+
+                    def reply(response, done=done):
+                        with lock:
+                            try:
+                                self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+                                self.wfile.flush()
+                            except OSError:
+                                pass  # client went away; the render itself still finished
+                        done.set()
+
+                    try:
+                        daemon.submit(json.loads(line), reply)
+                    except ValueError as e:
+                        reply({'status': 'error', 'message': f'Invalid JSON: {e}'})
+                for done in outstanding:
+                    done.wait()
+
+        if os.path.exists(path):
+            os.remove(path)
+        server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        server.daemon_threads = True
+        print(f"NapCast voice daemon listening on {path} with {self.poolSize} workers", file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if os.path.exists(path):
+                os.remove(path)
+
+def serve(socketPath=None, poolSize=DEFAULT_POOL_SIZE):
+    """Run the daemon on a Unix socket, or on stdin/stdout when socketPath is '-'."""
+    if socketPath == '-':
+        # Keep fd 1 for the protocol only: prints from the pipeline (and from
+        # the forked workers, which inherit the redirect) go to stderr.
+        protocolOut = os.fdopen(os.dup(1), 'w')
+        os.dup2(2, 1)
+        daemon = VoiceDaemon(poolSize)
+        try:
+            daemon.serveStdio(sys.stdin, protocolOut)
+        finally:
+            daemon.shutdown()
+        return
+
+    # Turn SIGTERM into a normal exit so the socket file gets cleaned up
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    daemon = VoiceDaemon(poolSize)
+    try:
+        daemon.serveSocket(socketPath or DEFAULT_SOCKET)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.shutdown()
+
+def submitJob(job, socketPath=DEFAULT_SOCKET, timeout=None):
+    """Send one job to a running daemon and wait for its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socketPath)
+        client.sendall((json.dumps(job) + '\n').encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile('r', encoding='utf-8') as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("Voice daemon closed the connection without a response")
+    return json.loads(line)
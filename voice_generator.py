@@ -5,9 +5,16 @@ This script integrates with the Node.js backend to generate audio from text.
 """
 
 import argparse
+import errno
 import os
 import sys
 import json
+import hashlib
+import random
+import time
+import shutil
+import tempfile
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -16,6 +23,30 @@ load_dotenv()
 # Add the current directory to Python path so we can import our modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+# Maximum number of chunks sent to the TTS provider at the same time
+DEFAULT_MAX_WORKERS = int(os.getenv('NAPCAST_TTS_WORKERS', '4'))
+
+# Average number of sentences between content-defined chunk boundaries
+STABLE_CHUNK_SPACING = 8
+
+# How often playSpeech retries a chunk the provider throttled
+THROTTLE_RETRIES = int(os.getenv('NAPCAST_THROTTLE_RETRIES', '3'))
+
+# Parent directory for per-render scratch space; point it at a tmpfs such as
+# /dev/shm to keep chunk files off disk. Defaults to the system temp dir.
+SCRATCH_DIR = os.getenv('NAPCAST_SCRATCH_DIR') or None
+
+# Typical speaking pace, used to estimate where a chunk falls in an episode
+# before it has been rendered
+SPEECH_CHARS_PER_SECOND = 15
+
+# Lazy rendering: minutes rendered up front, and how far ahead of the
+# playback position later chunks are synthesized
+LAZY_EAGER_SECONDS = float(os.getenv('NAPCAST_LAZY_EAGER_MINUTES', '20')) * 60
+LAZY_AHEAD_SECONDS = float(os.getenv('NAPCAST_LAZY_AHEAD_MINUTES', '10')) * 60
+
+DEEPGRAM_VOICES = ["aura-2-odysseus-en", "aura-2-thalia-en", "aura-2-amalthea-en", "aura-2-andromeda-en", "aura-2-apollo-en", "aura-2-arcas-en"]
+
 def speak_with_pyttsx3(text, fileName="speech", rate=150, voiceType=-1):
     try:
         import pyttsx3
@@ -45,30 +76,123 @@ def speak_with_gtts(text, fileName):
         tts = gTTS(text=text, lang='en')
         tts.save(f'{fileName}.mp3')
     except Exception as e:
+        response = getattr(e, 'rsp', None)
+        if response is not None and getattr(response, 'status_code', None) == 429:
+            # Let the scheduler see the throttle so it can back off and retry
+            from tts_scheduler import ProviderThrottled
+            raise ProviderThrottled(str(e)) from e
         print(f"An error occurred with gTTS: {e}")
     return fileName
         
 
 def speakDeepGram(text, voice, fileName):
+    from deepgram_client import DeepgramThrottled, getDeepgramClient
     try:
-        from deepgram import DeepgramClient, SpeakOptions
-        # Load API key from environment variable
-        api_key = os.getenv('DEEPGRAM_API_KEY')
-        if not api_key:
-            raise ValueError("DEEPGRAM_API_KEY not found in environment variables")
-        
-        deepgram = DeepgramClient(api_key)
-        voiceOptions = ["aura-2-odysseus-en", "aura-2-thalia-en", "aura-2-amalthea-en", "aura-2-andromeda-en", "aura-2-apollo-en", "aura-2-arcas-en"]
-        options = SpeakOptions(
-            model=voiceOptions[voice], # 0-5 inclusive
-        )
-        response = deepgram.speak.v("1").save(f'{fileName}.mp3', {"text": text}, options)
+        # Shared keep-alive client; reads DEEPGRAM_API_KEY on first use
+        getDeepgramClient().speak(text, DEEPGRAM_VOICES[voice], f'{fileName}.mp3') # voice 0-5 inclusive
 
         return fileName
+    except DeepgramThrottled:
+        raise # handled by the scheduler in playSpeech
     except Exception as e:
         print(f"An error occurred with Deepgram: {e}")
         return None
 
+SYNTHETIC_CHARS_PER_SECOND = 15
+SYNTHETIC_SAMPLE_RATE = 24000
+
+def speak_synthetic(text, voice, fileName):
+    # Offline, deterministic stand-in for a real provider: a tone (or silence
+    # with NAPCAST_SYNTHETIC_SIGNAL=silence) lasting as long as the text would
+    # take to read aloud. Used for local benchmarks and tests.
+    import math
+    from pydub import AudioSegment
+
+    seconds = max(len(text), 1) / SYNTHETIC_CHARS_PER_SECOND
+    frames = int(seconds * SYNTHETIC_SAMPLE_RATE)
+    if os.getenv('NAPCAST_SYNTHETIC_SIGNAL', 'tone') == 'silence':
+        raw = bytes(frames * 2)
+    else:
+        # One second of an integer-frequency tone is a whole number of periods,
+        # so it can be repeated without clicks.
+        frequency = 150 + 10 * (voice % 10)
+        second = b''.join(
+            int(3000 * math.sin(2 * math.pi * frequency * i / SYNTHETIC_SAMPLE_RATE)).to_bytes(2, 'little', signed=True)
+            for i in range(SYNTHETIC_SAMPLE_RATE)
+        )
+        raw = (second * (frames // SYNTHETIC_SAMPLE_RATE + 1))[:frames * 2]
+    sound = AudioSegment(data=raw, sample_width=2, frame_rate=SYNTHETIC_SAMPLE_RATE, channels=1)
+    sound.export(f'{fileName}.mp3', format="mp3", bitrate="48k")
+    return fileName
+
+class TTSProvider:
+    """A text-to-speech backend that writes <fileName>.mp3 for one chunk."""
+
+    def __init__(self, name, speak, model=None):
+        self.name = name
+        self._speak = speak
+        self._model = model
+
+    def speak(self, text, voice, fileName):
+        return self._speak(text, voice, fileName)
+
+    def model(self, voice):
+        # Voice model name, used in chunk cache keys
+        return self._model(voice) if self._model else str(voice)
+
+TTS_PROVIDERS = {
+    'deepgram': TTSProvider('deepgram', speakDeepGram, lambda voice: DEEPGRAM_VOICES[voice]),
+    'gtts': TTSProvider('gtts', lambda text, voice, fileName: speak_with_gtts(text, fileName), lambda voice: 'en'),
+    'pyttsx3': TTSProvider('pyttsx3', lambda text, voice, fileName: speak_with_pyttsx3(text, fileName)),
+    'synthetic': TTSProvider('synthetic', speak_synthetic),
+}
+
+# playSpeech modes
+TTS_MODES = {0: 'deepgram', 1: 'gtts', 2: 'pyttsx3', 3: 'synthetic'}
+
+def registerProvider(provider):
+    TTS_PROVIDERS[provider.name] = provider
+
+def getProvider(mode):
+    # NAPCAST_TTS_PROVIDER routes every chunk to one provider, e.g. "synthetic"
+    name = os.getenv('NAPCAST_TTS_PROVIDER') or TTS_MODES.get(mode, mode)
+    if name not in TTS_PROVIDERS:
+        raise ValueError(f"Unknown TTS provider: {name}")
+    return TTS_PROVIDERS[name]
+
+@contextmanager
+def renderWorkspace(prefix='napcast_'):
+    # Private scratch directory for one render, removed however the render
+    # ends, so concurrent renders never share chunk or temp files.
+    path = tempfile.mkdtemp(prefix=prefix, dir=SCRATCH_DIR)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def publishFile(source, destination):
+    # Move a finished file into place as a new inode. destination may be a
+    # hard link into the audio store, so it is always replaced, never
+    # written through: across filesystems the file is first copied next to
+    # destination and then renamed over it.
+    directory = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(directory, exist_ok=True)
+    try:
+        os.replace(source, destination)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    fd, tmpPath = tempfile.mkstemp(dir=directory, suffix='.part')
+    os.close(fd)
+    try:
+        shutil.copy2(source, tmpPath)
+        os.replace(tmpPath, destination)
+    except BaseException:
+        deleteFile(tmpPath)
+        raise
+    os.remove(source)
+
 def deleteFile(fileName):
     if os.path.exists(fileName):
         os.remove(fileName)
@@ -76,62 +200,180 @@ def deleteFile(fileName):
 def clean(text):
     return text.replace("'", '').replace('"', '').replace("_",'').replace('"','').replace('[','').replace(']','')
 
-def buildWords(text, charLimit):
-    import nltk
-    from nltk.tokenize import RegexpTokenizer
-    
-    query = ""
-    rest = ""
-    stop = False
-    tokenizer = RegexpTokenizer(r'\w+')
-    tokenized = tokenizer.tokenize(text)
-    if(len(tokenized[0]) > charLimit):
-        return "I give up."
-    for sent in tokenized:
-        
-        if stop == False and len(query)+len(sent) <= charLimit:
-            query+=' '+sent
+# NLTK tokenizers are expensive to construct (punkt unpickles its model), so
+# they are built once per process and shared by every chunking call.
+_TOKENIZERS = {}
+
+def _getTokenizer(kind):
+    tokenizer = _TOKENIZERS.get(kind)
+    if tokenizer is None:
+        if kind == 'sentence':
+            try:
+                from nltk.tokenize.punkt import PunktTokenizer
+                tokenizer = PunktTokenizer('english')
+            except ImportError:
+                import nltk
+                tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
         else:
-            stop = True
-            rest+=' '+sent
-    
-    query = query.strip()
-    rest = rest.strip()
+            from nltk.tokenize import RegexpTokenizer
+            tokenizer = RegexpTokenizer(r'\S+')
+        _TOKENIZERS[kind] = tokenizer
+    return tokenizer
 
-    list = [query]
-    if(len(rest)>0):
-        list += buildSentence(rest, charLimit)
-    return list
+def _iterWordChunks(text, charLimit):
+    # Split an over-long sentence on whitespace. Single words longer than the
+    # limit are cut into limit-sized pieces instead of being dropped.
+    parts = []
+    size = 0
+    for word in _getTokenizer('word').tokenize(text):
+        while len(word) > charLimit:
+            if parts:
+                yield ' '.join(parts)
+                parts, size = [], 0
+            yield word[:charLimit]
+            word = word[charLimit:]
+        if not word:
+            continue
+        if parts and size + 1 + len(word) > charLimit:
+            yield ' '.join(parts)
+            parts, size = [], 0
+        size += len(word) + (1 if parts else 0)
+        parts.append(word)
+    if parts:
+        yield ' '.join(parts)
 
-def buildSentence(text, charLimit):
-    import nltk
-    from nltk.tokenize import sent_tokenize
-    
-    query = ""
-    rest = ""
-    stop = False
-    tokenized = sent_tokenize(text)
-    if(len(tokenized[0]) > charLimit):
-        return buildWords(text, charLimit)
-    for sent in tokenized:
-        if stop == False and len(query)+len(sent) <= charLimit:
-            query+=sent
+def _isAnchor(sentence):
+    # Content-defined boundary: about one sentence in STABLE_CHUNK_SPACING
+    digest = hashlib.blake2b(sentence.encode('utf-8'), digest_size=4).digest()
+    return int.from_bytes(digest, 'big') % STABLE_CHUNK_SPACING == 0
+
+def _greedyChunkCount(lengths, charLimit, target):
+    # Chunks iterChunks yields for these sentence lengths when packing up to
+    # target; the word-split pieces of an over-long sentence count as one
+    # each (they can only be fewer, which does not change the comparison)
+    count = 0
+    size = 0
+    for length in lengths:
+        if length > charLimit:
+            count += (1 if size else 0) + 1
+            size = 0
+        elif size and size + 1 + length > target:
+            count += 1
+            size = length
         else:
-            stop = True
-            rest+=sent
+            size += length + (1 if size else 0)
+    return count + (1 if size else 0)
+
+def iterChunks(text, charLimit=2000, balance=False, stable=False):
+    """Yield provider-sized chunks of text.
 
-    list = [query]
-    if(len(rest)>0):
-        list += buildSentence(rest, charLimit)
-    return list
+    Sentences are packed greedily up to charLimit characters. With balance
+    set, they are packed up to the smallest size that still fits the text in
+    as many chunks as greedy packing needs, so parallel synthesis finishes at
+    about the same time instead of waiting on one long chunk. With stable
+    set, chunks end after "anchor" sentences picked by a hash of their
+    content, so editing one sentence only changes the chunks around it; the
+    rest of the plan lines up with the previous one again.
+    """
+    spans = _getTokenizer('sentence').span_tokenize(text)
+    target = charLimit
+    if balance and not stable and len(text) > charLimit:
+        spans = list(spans)
+        lengths = [end - start for start, end in spans]
+        count = _greedyChunkCount(lengths, charLimit, charLimit)
+        # Binary search the packing size; it never drops below a sentence
+        # that fits whole, so sentences are split exactly as before
+        low = max([0] + [length for length in lengths if length <= charLimit])
+        high = charLimit
+        while low < high:
+            middle = (low + high) // 2
+            if _greedyChunkCount(lengths, charLimit, middle) <= count:
+                high = middle
+            else:
+                low = middle + 1
+        target = low
+
+    parts = []
+    size = 0
+    for start, end in spans:
+        sentence = text[start:end]
+        if len(sentence) > charLimit:
+            if parts:
+                yield ' '.join(parts)
+                parts, size = [], 0
+            yield from _iterWordChunks(sentence, charLimit)
+            continue
+        if parts and size + 1 + len(sentence) > target:
+            yield ' '.join(parts)
+            parts, size = [], 0
+        size += len(sentence) + (1 if parts else 0)
+        parts.append(sentence)
+        if stable and size >= charLimit // 4 and _isAnchor(sentence):
+            yield ' '.join(parts)
+            parts, size = [], 0
+    if parts:
+        yield ' '.join(parts)
+
+def buildWords(text, charLimit):
+    return list(_iterWordChunks(text, charLimit))
+
+def buildSentence(text, charLimit):
+    return list(iterChunks(text, charLimit))
 
-def playSpeech(text, mode, fileName, iteration, voice):
+def playSpeech(text, mode, fileName, iteration, voice, rate=1.0, cache=None, profile=None):
+    # rate is the provider-side speaking rate; the assembly rate is applied later
+    from tts_cache import getChunkCache
+    from tts_failover import getFailover
+
+    start = time.perf_counter()
     newFileName = fileName+str(iteration)
-    if(mode==0):
-        speakDeepGram(text, voice, newFileName)
-    if(mode==1):
-        speak_with_gtts(text, newFileName)
-    return newFileName
+    provider = getProvider(mode)
+    if cache is None:
+        cache = getChunkCache()
+    key = None
+    if cache is not None:
+        key = cache.key(provider.name, provider.model(voice), rate, text)
+        if cache.fetch(key, f'{newFileName}.mp3'):
+            if profile is not None:
+                profile.addChunk(iteration, chars=len(text), provider='cache', seconds=time.perf_counter() - start,
+                                 bytes=os.path.getsize(f'{newFileName}.mp3'))
+            return newFileName, 'cache'
+
+    # Slow calls are hedged and failing providers fall back to the next tier
+    served = getFailover().run(provider.name, lambda name, attemptFile: speakWith(TTS_PROVIDERS[name], text, voice, attemptFile), newFileName)
+    if served is None:
+        raise RuntimeError(f"No TTS provider could synthesize chunk {iteration}")
+
+    # Only the requested provider's audio is cached under its key
+    if key is not None and served == provider.name:
+        cache.store(key, f'{newFileName}.mp3')
+    if profile is not None:
+        profile.addChunk(iteration, chars=len(text), provider=served, seconds=time.perf_counter() - start,
+                         bytes=os.path.getsize(f'{newFileName}.mp3'))
+    return newFileName, served
+
+def isFallback(served, mode):
+    # Audio from a failover tier, not the provider (or its cache) the mode asked for
+    return served not in ('cache', getProvider(mode).name)
+
+def speakWith(provider, text, voice, fileName):
+    # One provider call. All renders in the process share the provider's rate
+    # and concurrency limits; throttled calls are retried once the scheduler
+    # has backed off. Returns True if <fileName>.mp3 was written.
+    from tts_scheduler import getScheduler, isThrottle
+
+    scheduler = getScheduler()
+    for attempt in range(THROTTLE_RETRIES + 1):
+        try:
+            with scheduler.slot(provider.name):
+                provider.speak(text, voice, fileName)
+            break
+        except Exception as e:
+            if not isThrottle(e) or attempt == THROTTLE_RETRIES:
+                print(f"An error occurred with {provider.name}: {e}")
+                return False
+            time.sleep(random.uniform(0, 2 ** attempt))
+    return os.path.exists(f'{fileName}.mp3') and os.path.getsize(f'{fileName}.mp3') > 0
 
 def joinSounds(output, files):
     from moviepy.editor import concatenate_audioclips, AudioFileClip
@@ -139,85 +381,894 @@ def joinSounds(output, files):
     final_clip = concatenate_audioclips(clips)
     final_clip.write_audiofile(f"{output}.mp3")
 
-def speed_change(sound, speed=1.0):
-    from pydub import AudioSegment
+def speed_change(sound, speed=1.0, preservePitch=False):
+    if preservePitch:
+        # WSOLA time stretch: slower or faster speech at the original pitch
+        from time_stretch import stretchSegment
+        return stretchSegment(sound, speed)
+    # Resampling trick: the pitch moves with the speed
     sound_with_altered_frame_rate = sound._spawn(sound.raw_data, overrides={
         "frame_rate": int(sound.frame_rate * speed)
     })
     return sound_with_altered_frame_rate.set_frame_rate(sound.frame_rate)
 
-def organizeSpeech(text, mode, voice, fileName='speech', rate=1.0):
+def synthesizeChunks(build, mode, fileName, voice, maxWorkers=DEFAULT_MAX_WORKERS, profile=None):
+    # Fan the chunks out over a bounded thread pool. The provider calls are
+    # network bound, so threads are enough; map() hands results back in
+    # submission order, so the file list still follows the script.
+    # Returns the chunk files and the tier that served each one.
+    from concurrent.futures import ThreadPoolExecutor
+
+    if maxWorkers is None or maxWorkers < 1:
+        maxWorkers = 1
+    if maxWorkers == 1 or len(build) <= 1:
+        results = [playSpeech(section, mode, fileName, counter, voice, profile=profile) for counter, section in enumerate(build)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(maxWorkers, len(build))) as pool:
+            results = list(pool.map(lambda job: playSpeech(job[1], mode, fileName, job[0], voice, profile=profile), enumerate(build)))
+    return [f'{name}.mp3' for name, _ in results], [served for _, served in results]
+
+@contextmanager
+def stageTimer(timings, stage):
+    # Accumulate wall time per pipeline stage into the timings dict, if any.
+    # A RenderProfile records memory as well.
+    if hasattr(timings, 'stage'):
+        with timings.stage(stage):
+            yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def stageBytes(timings, stage, count):
+    # Bytes a stage produced, recorded when timings is a RenderProfile
+    if hasattr(timings, 'addBytes'):
+        timings.addBytes(stage, count)
+
+def assembleMoviepy(files, output, rate=1.0, timings=None, preservePitch=False):
+    # Original assembly path: moviepy concatenation into temp.mp3, then a
+    # second decode through pydub for the speed change.
     from pydub import AudioSegment
     from moviepy.editor import concatenate_audioclips, AudioFileClip
-    
-    build = buildSentence(clean(text), 2000)
-    counter = 0
-    files = []
-    for section in build:
-        files.append(f'{playSpeech(section, mode, fileName, counter, voice)}.mp3')
-        counter+=1
-    
-    clips = [AudioFileClip(c) for c in files]
-    final_clip = concatenate_audioclips(clips)
-    final_clip.write_audiofile("temp.mp3")
 
-    sound = AudioSegment.from_file("temp.mp3")
-    newSound = speed_change(sound, rate)
-    newSound.export(f"{fileName}.mp3", format="mp3")
+    # The intermediate file lives next to the chunks, in the render's workspace
+    tempFile = os.path.join(os.path.dirname(os.path.abspath(files[0])), "temp.mp3")
+    with stageTimer(timings, 'concatenate'):
+        clips = [AudioFileClip(c) for c in files]
+        final_clip = concatenate_audioclips(clips)
+        final_clip.write_audiofile(tempFile)
 
-    deleteFile("temp.mp3")
-    for clip in files:
-        deleteFile(clip)
+    with stageTimer(timings, 'decode'):
+        sound = AudioSegment.from_file(tempFile)
+    with stageTimer(timings, 'speedChange'):
+        newSound = speed_change(sound, rate, preservePitch)
+    with stageTimer(timings, 'encode'):
+        newSound.export(output, format="mp3")
 
-def createVoiceOver(text, mode, stupify=False):
-    if(stupify):
-        # Import thesaurus if available
+    deleteFile(tempFile)
+
+def assemblePcm(files, output, rate=1.0, timings=None, preservePitch=False, maxWorkers=DEFAULT_MAX_WORKERS):
+    # Decode each chunk once, join the PCM buffers in memory, apply the rate
+    # change there and encode a single time. Pitch-preserving stretches run
+    # per chunk on a thread pool before the join.
+    from concurrent.futures import ThreadPoolExecutor
+    from pydub import AudioSegment
+
+    with stageTimer(timings, 'decode'):
+        segments = [AudioSegment.from_file(c) for c in files]
+        base = segments[0]
+        segments = [seg.set_frame_rate(base.frame_rate).set_channels(base.channels).set_sample_width(base.sample_width) for seg in segments]
+    if rate != 1 and preservePitch:
+        with stageTimer(timings, 'speedChange'):
+            with ThreadPoolExecutor(max_workers=max(1, maxWorkers or 1)) as pool:
+                segments = list(pool.map(lambda seg: speed_change(seg, rate, True), segments))
+    with stageTimer(timings, 'decode'):
+        sound = base._spawn(b''.join(seg.raw_data for seg in segments))
+    if rate != 1 and not preservePitch:
+        with stageTimer(timings, 'speedChange'):
+            sound = speed_change(sound, rate)
+    with stageTimer(timings, 'encode'):
+        sound.export(output, format="mp3")
+
+STREAM_BLOCK_BYTES = 256 * 1024
+
+def assembleStream(files, output, rate=1.0, timings=None, preservePitch=False, hls=None):
+    # Constant-memory assembly for long episodes. Chunks are decoded one at
+    # a time by ffmpeg and their PCM is piped, block by block, through the
+    # rate change into a single ffmpeg encoder. At most two ffmpeg processes
+    # are open and only one block of audio is held, however long the episode.
+    # With hls (a directory) the same encoder also writes the HLS renditions.
+    import subprocess
+    import hls_packaging
+    import numpy as np
+    from pydub.utils import get_encoder_name, mediainfo_json
+
+    ffmpeg = get_encoder_name()
+    # Every chunk is decoded to the first chunk's format
+    info = next(stream for stream in mediainfo_json(files[0])['streams'] if stream.get('codec_type') == 'audio')
+    sampleRate = int(info['sample_rate'])
+    channels = int(info['channels'])
+    frameBytes = 2 * channels
+
+    stretcher = None
+    inputRate = sampleRate
+    if rate != 1 and preservePitch:
+        from time_stretch import WsolaStretcher
+        stretcher = WsolaStretcher(rate, sampleRate, channels)
+    elif rate != 1:
+        # Same resampling trick as speed_change: label the PCM with a
+        # different rate and let the encoder resample it back
+        inputRate = int(sampleRate * rate)
+
+    def toPcm(samples):
+        return np.clip(np.rint(samples), -32768, 32767).astype(np.int16).tobytes()
+
+    packageArgs = []
+    if hls is not None:
+        os.makedirs(hls, exist_ok=True)
+        packageArgs = hls_packaging.outputArgs(hls)
+    encoder = subprocess.Popen(
+        [ffmpeg, '-v', 'error', '-y', '-f', 's16le', '-ar', str(inputRate), '-ac', str(channels), '-i', 'pipe:0',
+         '-ar', str(sampleRate), '-f', 'mp3', output] + packageArgs,
+        stdin=subprocess.PIPE,
+    )
+    try:
+        for chunkFile in files:
+            decoder = subprocess.Popen(
+                [ffmpeg, '-v', 'error', '-i', chunkFile, '-f', 's16le', '-ar', str(sampleRate), '-ac', str(channels), 'pipe:1'],
+                stdout=subprocess.PIPE,
+            )
+            leftover = b''
+            try:
+                while True:
+                    with stageTimer(timings, 'decode'):
+                        block = decoder.stdout.read(STREAM_BLOCK_BYTES)
+                    if not block:
+                        break
+                    stageBytes(timings, 'decode', len(block))
+                    # Pipe reads can end mid-sample; carry the remainder over
+                    block = leftover + block
+                    usable = len(block) - len(block) % frameBytes
+                    block, leftover = block[:usable], block[usable:]
+                    if stretcher is not None:
+                        with stageTimer(timings, 'speedChange'):
+                            block = toPcm(stretcher.process(np.frombuffer(block, dtype=np.int16).reshape(-1, channels)))
+                    with stageTimer(timings, 'encode'):
+                        encoder.stdin.write(block)
+                    stageBytes(timings, 'encode', len(block))
+            finally:
+                decoder.stdout.close()
+                if decoder.wait() != 0:
+                    raise RuntimeError(f"ffmpeg could not decode {chunkFile}")
+        if stretcher is not None:
+            with stageTimer(timings, 'speedChange'):
+                block = toPcm(stretcher.flush())
+            with stageTimer(timings, 'encode'):
+                encoder.stdin.write(block)
+            stageBytes(timings, 'encode', len(block))
+        with stageTimer(timings, 'encode'):
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                raise RuntimeError("ffmpeg could not encode the episode")
+    except BaseException:
+        encoder.kill()
+        encoder.wait()
+        raise
+    if hls is not None:
+        packaged = hls_packaging.writeMasterPlaylist(hls)
+        stageBytes(timings, 'package', packaged['bytes'])
+        return packaged
+
+def assembleFrames(files, output, rate=1.0, timings=None, preservePitch=False, hls=None):
+    # Without a rate change the chunks' MP3 frames are joined as they are:
+    # no decode, no re-encode, no quality loss. Chunks that were encoded
+    # differently, or a rate change, go through the stream engine instead.
+    import mp3_frames
+
+    if rate == 1:
         try:
-            import thesaurus as th
-            from nltk.tokenize import RegexpTokenizer
-            tokenizer = RegexpTokenizer(r'\w+')
-            tokenized = tokenizer.tokenize(text)
-            complete = ''
-            for i in tokenized:
-                complete+= th.getSyn(i)
-            text = complete
-            print(text)
-        except ImportError:
-            print("Thesaurus module not available, skipping stupify")
+            with stageTimer(timings, 'concatenate'):
+                joined = mp3_frames.concatenate(files, output)
+            stageBytes(timings, 'concatenate', joined['bytes'])
+            return packageHls(output, hls, timings) if hls is not None else None
+        except mp3_frames.Mp3FrameError as e:
+            print(f"Cannot join chunks frame by frame, re-encoding: {e}")
+    return assembleStream(files, output, rate, timings, preservePitch, hls)
+
+def packageHls(source, hls, timings=None):
+    # HLS renditions of a finished master file, all from one ffmpeg run
+    import hls_packaging
+
+    with stageTimer(timings, 'package'):
+        packaged = hls_packaging.package(source, hls)
+    stageBytes(timings, 'package', packaged['bytes'])
+    return packaged
+
+ASSEMBLY_ENGINES = {
+    'moviepy': assembleMoviepy,
+    'pcm': assemblePcm,
+    'stream': assembleStream,
+    'frames': assembleFrames,
+}
+DEFAULT_ENGINE = os.getenv('NAPCAST_ASSEMBLY_ENGINE', 'frames')
+# Engines that produce the HLS renditions themselves; the others are
+# packaged from their output afterwards
+HLS_ENGINES = {'stream', 'frames'}
+
+def organizeSpeech(text, mode, voice, fileName='speech', rate=1.0, maxWorkers=DEFAULT_MAX_WORKERS, engine=DEFAULT_ENGINE, timings=None, output=None, preservePitch=False, hls=None):
+    # Writes <fileName>.mp3, or output when given, and with hls (a directory)
+    # an HLS package of the episode, whose summary is returned. Chunks and
+    # intermediate files stay in a private workspace and the results are
+    # moved into place only once they are complete.
+    import hls_packaging
+
+    if engine not in ASSEMBLY_ENGINES:
+        raise ValueError(f"Unknown assembly engine: {engine}")
+    if output is None:
+        output = f"{fileName}.mp3"
+
+    profile = timings if hasattr(timings, 'addChunk') else None
+
+    with renderWorkspace() as workspace:
+        with stageTimer(timings, 'chunking'):
+            build = list(iterChunks(clean(text), 2000, balance=maxWorkers is not None and maxWorkers > 1))
+        with stageTimer(timings, 'synthesis'):
+            files, served = synthesizeChunks(build, mode, os.path.join(workspace, 'speech'), voice, maxWorkers, profile)
+
+        rendered = os.path.join(workspace, 'output.mp3')
+        packageDir = os.path.join(workspace, 'hls') if hls is not None else None
+        if packageDir is not None and engine in HLS_ENGINES:
+            packaged = ASSEMBLY_ENGINES[engine](files, rendered, rate, timings, preservePitch=preservePitch, hls=packageDir)
+        else:
+            ASSEMBLY_ENGINES[engine](files, rendered, rate, timings, preservePitch=preservePitch)
+            packaged = packageHls(rendered, packageDir, timings) if packageDir is not None else None
+        if profile is not None:
+            profile.addBytes('chunking', len(text.encode('utf-8')))
+            profile.addBytes('synthesis', sum(os.path.getsize(f) for f in files))
+            profile.finish(chunks=len(files), engine=engine, rate=rate, outputBytes=os.path.getsize(rendered),
+                           fallbackChunks=len([tier for tier in served if isFallback(tier, mode)]))
+        publishFile(rendered, output)
+        if packageDir is not None:
+            hls_packaging.publish(packageDir, hls)
+        return packaged
+
+def stupifyText(text, seed=0):
+    # Import thesaurus if available
+    try:
+        import thesaurus as th
+        # Precompiled index, memoized per document; the same seed always
+        # gives the same text, which keeps chunk cache hits possible
+        text = th.transform(text, seed)
+        print(text)
+    except ImportError:
+        print("Thesaurus module not available, skipping stupify")
+    return text
+
+def createVoiceOver(text, mode, stupify=False, maxWorkers=DEFAULT_MAX_WORKERS, engine=DEFAULT_ENGINE, output='audio.mp3', profile=None, hls=None):
+    # profile: optional RenderProfile filled in with per-stage and per-chunk figures
+    # hls: optional directory for an HLS package of the episode
+    if(stupify):
+        with stageTimer(profile, 'stupify'):
+            text = stupifyText(text)
     
+    settings = voiceModeSettings(mode)
+    if settings is not None:
+        ttsMode, voice, rate = settings
+        return organizeSpeech(text, ttsMode, voice, 'audio', rate, maxWorkers, engine, profile, output, preservePitch=mode in PITCH_PRESERVING_MODES, hls=hls)
+
+def encodeChunk(fileName, rate=1.0, preservePitch=False):
+    # Encode one synthesized chunk as bare MP3 frames (no ID3 or Xing header)
+    # so consecutive chunks can be played back as one continuous stream.
+    import io
+    from pydub import AudioSegment
+
+    sound = AudioSegment.from_file(fileName)
+    if rate != 1:
+        sound = speed_change(sound, rate, preservePitch)
+    buffer = io.BytesIO()
+    sound.export(buffer, format="mp3", parameters=["-id3v2_version", "0", "-write_xing", "0"])
+    return buffer.getvalue()
+
+def streamSpeech(text, mode, voice, fileName='speech', rate=1.0, maxWorkers=DEFAULT_MAX_WORKERS, output=None, preservePitch=False, onPublished=None):
+    """Yield encoded MP3 data chunk by chunk, in script order.
+
+    Rendering runs on a background thread, in its own workspace, and does
+    not wait for the consumer, so the rest of the episode keeps rendering
+    even if the client reads slowly or disconnects. When output is given the
+    complete episode is moved there once every chunk is done, and then
+    onPublished(output, fallbackChunks) is called on the render thread with
+    the number of chunks a failover tier had to serve.
+    """
+    import queue
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    frames = queue.Queue()
+    done = object()
+
+    fallback = []
+
+    def renderChunk(section, chunkBase, counter):
+        # Synthesis, speed change and encoding all happen on the pool thread
+        name, served = playSpeech(section, mode, chunkBase, counter, voice)
+        if isFallback(served, mode):
+            fallback.append(counter)
+        chunkFile = f'{name}.mp3'
+        try:
+            return encodeChunk(chunkFile, rate, preservePitch)
+        finally:
+            deleteFile(chunkFile)
+
+    def render():
+        try:
+            with renderWorkspace() as workspace:
+                build = list(iterChunks(clean(text), 2000, balance=maxWorkers is not None and maxWorkers > 1))
+                chunkBase = os.path.join(workspace, os.path.basename(fileName))
+                rendered = os.path.join(workspace, 'output.mp3')
+                with open(rendered, 'wb') as master:
+                    with ThreadPoolExecutor(max_workers=max(1, min(maxWorkers or 1, len(build) or 1))) as pool:
+                        futures = [pool.submit(renderChunk, section, chunkBase, counter) for counter, section in enumerate(build)]
+                        for future in futures:
+                            data = future.result()
+                            master.write(data)
+                            frames.put(data)
+                if output:
+                    publishFile(rendered, output)
+            if output and onPublished is not None:
+                try:
+                    onPublished(output, len(fallback))
+                except Exception as e:
+                    print(f"Post-render step for {output} failed: {e}")
+            frames.put(done)
+        except Exception as e:
+            frames.put(e)
+
+    def drain():
+        while True:
+            item = frames.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    threading.Thread(target=render, daemon=True).start()
+    return drain()
+
+def streamVoiceOver(text, mode, stupify=False, maxWorkers=DEFAULT_MAX_WORKERS, fileName='speech', output=None, onPublished=None, rate=None):
+    # rate overrides the voice mode's rate
+    if(stupify):
+        text = stupifyText(text)
+
+    settings = voiceModeSettings(mode)
+    if settings is None:
+        raise ValueError(f"Unknown voice mode: {mode}")
+    ttsMode, voice, modeRate = settings
+    if rate is None:
+        rate = modeRate
+    return streamSpeech(text, ttsMode, voice, fileName, rate, maxWorkers, output, mode in PITCH_PRESERVING_MODES, onPublished)
+
+def generate_audio_from_text(text, voice_mode=0, rate=None, stupify=False, output='bytes', maxWorkers=DEFAULT_MAX_WORKERS, engine=DEFAULT_ENGINE, profile=None):
+    """Render text in-process and return the encoded MP3.
+
+    output selects the return type: 'bytes', 'file' (a seekable file-like
+    object) or 'stream' (an iterator of MP3 frames that starts yielding as
+    soon as the first chunk is ready). rate overrides the voice mode's rate.
+    Pass a render_profile.RenderProfile as profile to get per-stage and
+    per-chunk figures for a 'bytes' or 'file' render.
+    Nothing is written outside a private, self-cleaning workspace.
+    """
+    import io
+
+    settings = voiceModeSettings(voice_mode)
+    if settings is None:
+        raise ValueError(f"Unknown voice mode: {voice_mode}")
+    ttsMode, voice, modeRate = settings
+    if rate is None:
+        rate = modeRate
+    if(stupify):
+        with stageTimer(profile, 'stupify'):
+            text = stupifyText(text)
+
+    preservePitch = voice_mode in PITCH_PRESERVING_MODES
+    if output == 'stream':
+        return streamSpeech(text, ttsMode, voice, 'speech', rate, maxWorkers, preservePitch=preservePitch)
+    if output not in ('bytes', 'file'):
+        raise ValueError(f"Unknown output type: {output}")
+
+    with renderWorkspace() as workspace:
+        rendered = os.path.join(workspace, 'audio.mp3')
+        organizeSpeech(text, ttsMode, voice, 'speech', rate, maxWorkers, engine, profile, rendered, preservePitch)
+        with open(rendered, 'rb') as f:
+            data = f.read()
+    return data if output == 'bytes' else io.BytesIO(data)
+
+def planChunks(text, voice_mode, rate=None):
+    # Stable chunk plan for a script: one entry per chunk with its content
+    # key (provider, voice, rate, pitch handling and text) and an estimated
+    # duration. rate overrides the voice mode's rate. Returns the chunk texts
+    # and the plan.
+    from tts_cache import contentKey
+
+    settings = voiceModeSettings(voice_mode)
+    if settings is None:
+        raise ValueError(f"Unknown voice mode: {voice_mode}")
+    ttsMode, voice, modeRate = settings
+    rate = modeRate if rate is None else rate
+    preservePitch = voice_mode in PITCH_PRESERVING_MODES
+    provider = getProvider(ttsMode)
+    model = provider.model(voice)
+
+    sections = list(iterChunks(clean(text), 2000, stable=True))
+    plan = [
+        {
+            'key': contentKey(provider.name, model, rate, section, 'pitch' if preservePitch else ''),
+            'chars': len(section),
+            'seconds': round(len(section) / SPEECH_CHARS_PER_SECOND / rate, 2),
+        }
+        for section in sections
+    ]
+    return sections, plan
+
+FALLBACK_MARKER = '.fallback'
+
+def chunkReady(chunkDir, key):
+    # A chunk is done once its file exists and was not served by a failover
+    # tier; fallback audio plays, but is rendered again on the next pass
+    path = os.path.join(chunkDir, f'{key}.mp3')
+    return os.path.exists(path) and not os.path.exists(path + FALLBACK_MARKER)
+
+def fallbackChunks(chunkDir, keys):
+    # How many of keys currently hold failover-tier audio
+    return len([key for key in set(keys) if os.path.exists(os.path.join(chunkDir, f'{key}.mp3{FALLBACK_MARKER}'))])
+
+def deleteChunk(chunkDir, key):
+    path = os.path.join(chunkDir, f'{key}.mp3')
+    deleteFile(path)
+    deleteFile(path + FALLBACK_MARKER)
+
+def renderPlanChunks(jobs, voice_mode, chunkDir, maxWorkers=DEFAULT_MAX_WORKERS, rate=None):
+    # Synthesize (key, text) jobs in parallel into chunkDir/<key>.mp3 as bare
+    # MP3 frames at the voice mode's rate, or rate when given. A chunk served
+    # by a failover tier gets a <key>.mp3.fallback marker, since the key names
+    # the requested provider and voice. Returns {key: seconds}.
+    from concurrent.futures import ThreadPoolExecutor
+    import mp3_frames
+
+    ttsMode, voice, modeRate = voiceModeSettings(voice_mode)
+    rate = modeRate if rate is None else rate
+    preservePitch = voice_mode in PITCH_PRESERVING_MODES
+    jobs = list(dict(jobs).items())
+    os.makedirs(chunkDir, exist_ok=True)
+
+    with renderWorkspace() as workspace:
+        def renderChunk(job):
+            counter, (key, section) = job
+            name, served = playSpeech(section, ttsMode, os.path.join(workspace, "speech"), counter, voice)
+            chunkFile = f'{name}.mp3'
+            data = encodeChunk(chunkFile, rate, preservePitch)
+            deleteFile(chunkFile)
+            rendered = os.path.join(workspace, f'{key}.mp3')
+            with open(rendered, 'wb') as f:
+                f.write(data)
+            seconds = mp3_frames.duration(rendered)
+            destination = os.path.join(chunkDir, f'{key}.mp3')
+            if isFallback(served, ttsMode):
+                open(destination + FALLBACK_MARKER, 'w').close()
+                publishFile(rendered, destination)
+            else:
+                publishFile(rendered, destination)
+                deleteFile(destination + FALLBACK_MARKER)
+            return key, round(seconds, 2)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(maxWorkers or 1, len(jobs) or 1))) as pool:
+            return dict(pool.map(renderChunk, enumerate(jobs)))
+
+def renderIncremental(text, voice_mode, output, chunkDir, previousPlan=None, maxWorkers=DEFAULT_MAX_WORKERS, hls=None):
+    """Re-render an edited script, synthesizing only the chunks that changed.
+
+    Chunks are planned with stable boundaries, rendered at the voice mode's
+    rate and kept in chunkDir as bare MP3 frames named by a content key.
+    The plan from the previous render is diffed against the new one:
+    unchanged chunks are reused from chunkDir, new ones are synthesized in
+    parallel, chunks that dropped out of the plan are deleted, and output is
+    spliced together from the chunk files without another transcode, as
+    long as they all share one MP3 format.
+    With hls (a directory) the result is also packaged as HLS there.
+    Returns the new plan (to be stored for the next edit) and counts.
+    """
+    import hls_packaging
+
+    import difflib
+
+    sections, plan = planChunks(text, voice_mode)
+    oldKeys = [entry['key'] for entry in (previousPlan or [])]
+    newKeys = [entry['key'] for entry in plan]
+
+    chunkPath = lambda key: os.path.join(chunkDir, f'{key}.mp3')
+    unchanged = set()
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, oldKeys, newKeys, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            unchanged.update(newKeys[j1:j2])
+    # Content-addressed, so a moved chunk whose file survived is reused too
+    missing = [(key, section) for key, section in zip(newKeys, sections) if not chunkReady(chunkDir, key)]
+    durations = renderPlanChunks(missing, voice_mode, chunkDir, maxWorkers)
+    for entry in plan:
+        entry['seconds'] = durations.get(entry['key'], entry['seconds'])
+        entry['rendered'] = True
+
+    with renderWorkspace() as workspace:
+        # A chunk from a failover tier can be in another MP3 format than its
+        # neighbours; the frame join re-encodes the episode when it is
+        spliced = os.path.join(workspace, 'output.mp3')
+        packageDir = os.path.join(workspace, 'hls') if hls is not None else None
+        packaged = assembleFrames([chunkPath(key) for key in newKeys], spliced, hls=packageDir)
+        publishFile(spliced, output)
+        if packageDir is not None:
+            hls_packaging.publish(packageDir, hls)
+
+    removed = set(oldKeys) - set(newKeys)
+    for key in removed:
+        deleteChunk(chunkDir, key)
+
+    return {
+        'plan': plan,
+        'chunks': len(plan),
+        'unchanged': len([key for key in newKeys if key in unchanged]),
+        'synthesized': len(durations),
+        'removed': len(removed),
+        'fallback': fallbackChunks(chunkDir, newKeys),
+        'hls': packaged,
+    }
+
+def renderLazy(text, voice_mode, chunkDir, plan=None, position=0.0, aheadSeconds=LAZY_EAGER_SECONDS, maxWorkers=DEFAULT_MAX_WORKERS):
+    """Render only the part of an episode a listener is about to hear.
+
+    Chunks that play between position and position + aheadSeconds (in
+    seconds of episode audio) and are not in chunkDir yet are synthesized;
+    everything later is left for a subsequent call. Called with position 0
+    when the episode is created and again as playback progresses. The plan
+    is rebuilt from text each time, so an edited script only re-renders the
+    chunks that changed; durations of rendered chunks carry over from the
+    given plan. Returns the updated plan and counts.
+    """
+    sections, newPlan = planChunks(text, voice_mode)
+    known = {entry['key']: entry for entry in plan or []}
+
+    jobs = []
+    start = 0.0
+    for entry, section in zip(newPlan, sections):
+        entry['rendered'] = chunkReady(chunkDir, entry['key'])
+        # Known durations also cover fallback chunks waiting to be redone
+        if entry['key'] in known:
+            entry['seconds'] = known[entry['key']]['seconds']
+        end = start + entry['seconds']
+        if not entry['rendered'] and end > position and start < position + aheadSeconds:
+            jobs.append((entry['key'], section))
+        start = end
+
+    durations = renderPlanChunks(jobs, voice_mode, chunkDir, maxWorkers) if jobs else {}
+    for entry in newPlan:
+        if entry['key'] in durations:
+            entry['seconds'] = durations[entry['key']]
+            entry['rendered'] = True
+
+    removed = set(known) - {entry['key'] for entry in newPlan}
+    for key in removed:
+        deleteChunk(chunkDir, key)
+
+    return {
+        'plan': newPlan,
+        'chunks': len(newPlan),
+        'rendered': len([entry for entry in newPlan if entry['rendered']]),
+        'synthesized': len(durations),
+        'removed': len(removed),
+        'fallback': fallbackChunks(chunkDir, [entry['key'] for entry in newPlan]),
+        'renderedSeconds': round(sum(entry['seconds'] for entry in newPlan if entry['rendered']), 2),
+        'totalSeconds': round(sum(entry['seconds'] for entry in newPlan), 2),
+    }
+
+def encodeSilence(seconds, sampleRate, channels):
+    # Bare MP3 frames of silence, encoded like encodeChunk's output
+    import io
+    from pydub import AudioSegment
+
+    sound = AudioSegment.silent(duration=int(round(seconds * 1000)), frame_rate=sampleRate).set_channels(channels)
+    buffer = io.BytesIO()
+    sound.export(buffer, format="mp3", parameters=["-id3v2_version", "0", "-write_xing", "0"])
+    return buffer.getvalue()
+
+def renderSegments(segments, voice_mode, output, chunkDir, previousPlan=None, maxWorkers=DEFAULT_MAX_WORKERS, hls=None):
+    """Render a script segment by segment, each with its own voice and rate.
+
+    segments are script segments as stored on an episode: {type, content,
+    timestamp, duration} plus optional voiceMode and rate, which default to
+    voice_mode and that mode's rate. Every segment is planned into
+    content-keyed chunks in chunkDir like renderIncremental's, so a segment
+    whose text, voice and rate did not change is reused as it is. Segments
+    are synthesized concurrently and then laid out on the timeline: each
+    starts at its timestamp, with silence filling any gap before it, or
+    right after the previous segment if that one runs past the timestamp.
+    With hls (a directory) the episode is also packaged as HLS there.
+    Returns the combined plan (each entry carries its segment and start
+    time), the actual layout of the segments and counts.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import hls_packaging
+    import mp3_frames
+
+    chunkPath = lambda key: os.path.join(chunkDir, f'{key}.mp3')
+    planned = []
+    for index, segment in enumerate(segments):
+        mode = int(segment.get('voiceMode', voice_mode))
+        rate = segment.get('rate')
+        rate = float(rate) if rate is not None else None
+        sections, plan = planChunks(segment.get('content', ''), mode, rate)
+        missing = [(entry['key'], section) for entry, section in zip(plan, sections) if not chunkReady(chunkDir, entry['key'])]
+        planned.append((index, segment, mode, rate, plan, missing))
+
+    def renderSegment(job):
+        index, segment, mode, rate, plan, missing = job
+        return renderPlanChunks(missing, mode, chunkDir, maxWorkers, rate) if missing else {}
+
+    jobs = [job for job in planned if job[5]]
+    durations = {}
+    if jobs:
+        # Segments are the unit of parallelism; provider limits still hold
+        # through the shared TTS scheduler
+        with ThreadPoolExecutor(max_workers=max(1, min(maxWorkers or 1, len(jobs)))) as pool:
+            for rendered in pool.map(renderSegment, jobs):
+                durations.update(rendered)
+
+    combined = []
+    layout = []
+    files = []
+    cursor = 0.0
+    with renderWorkspace() as workspace:
+        silences = 0
+        for index, segment, mode, rate, plan, missing in planned:
+            if not plan:
+                continue
+            timestamp = segment.get('timestamp')
+            start = cursor
+            if isinstance(timestamp, (int, float)) and timestamp - cursor > 0.05:
+                _, _, _, header, _ = mp3_frames.scan(chunkPath(plan[0]['key']))
+                silence = os.path.join(workspace, f'silence{silences}.mp3')
+                silences += 1
+                with open(silence, 'wb') as f:
+                    f.write(encodeSilence(timestamp - cursor, header.sampleRate, 1 if header.mode == mp3_frames.MONO else 2))
+                files.append(silence)
+                start = cursor = float(timestamp)
+            for entry in plan:
+                key = entry['key']
+                entry['seconds'] = durations[key] if key in durations else round(mp3_frames.duration(chunkPath(key)), 2)
+                entry['rendered'] = True
+                entry['segment'] = index
+                entry['start'] = round(cursor, 2)
+                cursor += entry['seconds']
+                files.append(chunkPath(key))
+                combined.append(entry)
+            layout.append({
+                'index': index,
+                'type': segment.get('type'),
+                'voiceMode': mode,
+                'rate': rate if rate is not None else voiceModeSettings(mode)[2],
+                'timestamp': timestamp,
+                'start': round(start, 2),
+                'seconds': round(cursor - start, 2),
+                'chunks': len(plan),
+                'synthesized': len(missing),
+            })
+        if not files:
+            raise ValueError("Script has no segments to render")
+
+        # Segments in different voices can come out in different formats;
+        # the frame join falls back to re-encoding when they do
+        rendered = os.path.join(workspace, 'output.mp3')
+        packageDir = os.path.join(workspace, 'hls') if hls is not None else None
+        packaged = assembleFrames(files, rendered, hls=packageDir)
+        publishFile(rendered, output)
+        if packageDir is not None:
+            hls_packaging.publish(packageDir, hls)
+
+    removed = {entry['key'] for entry in previousPlan or []} - {entry['key'] for entry in combined}
+    for key in removed:
+        deleteChunk(chunkDir, key)
+
+    return {
+        'plan': combined,
+        'segments': layout,
+        'chunks': len(combined),
+        'unchanged': len(combined) - len(durations),
+        'synthesized': len(durations),
+        'removed': len(removed),
+        'fallback': fallbackChunks(chunkDir, [entry['key'] for entry in combined]),
+        'totalSeconds': round(cursor, 2),
+        'hls': packaged,
+    }
+
+# Sleepy modes slow speech down without dropping the pitch; the chipmunk
+# mode keeps the resampling pitch shift on purpose
+PITCH_PRESERVING_MODES = {0, 2}
+
+def voiceModeSettings(mode):
+    # (tts mode, voice, rate) for each NapCast voice mode
     if(mode==0):
-        organizeSpeech(text, 0, 5, 'audio', 0.8) # Boring sleepy
+        return (0, 5, 0.8) # Boring sleepy
     elif(mode==1):
-        organizeSpeech(text, 0, 2, 'audio', 1.7) # chipmunk?
+        return (0, 2, 1.7) # chipmunk?
     elif(mode==2):
-        organizeSpeech(text, 1, 0, 'audio', 0.5) # slow gtts. rate adjustable
+        return (1, 0, 0.5) # slow gtts. rate adjustable
     elif(mode==3):
-        organizeSpeech(text, 1, 5, 'audio', 1) # basic gtts
+        return (1, 5, 1) # basic gtts
     elif(mode > 3):
-        organizeSpeech(text, 0, mode-3, 'audio', 1) # additional deepgram voices
+        return (0, mode-3, 1) # additional deepgram voices
+    return None
+
+DEFAULT_BATCH_JOBS = int(os.getenv('NAPCAST_BATCH_JOBS', '2'))
+
+def runBatch(manifest, results, jobs=DEFAULT_BATCH_JOBS, maxWorkers=DEFAULT_MAX_WORKERS, engine=DEFAULT_ENGINE, force=False):
+    """Render every entry of a JSONL manifest in this process.
+
+    Each line is {"text_file": ... | "text": ..., "output": ..., "voice_mode": 0,
+    "stupify": false, "id": ...}; relative paths are taken from the manifest's
+    directory. Up to `jobs` episodes render at once and share the process's
+    provider clients, scheduler and chunk cache. Entries whose output
+    already exists are skipped unless force is set, so an interrupted
+    backfill can simply be run again. One result line per entry is appended
+    to results as it finishes. Returns the count per status.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    baseDir = os.path.dirname(os.path.abspath(manifest))
+    resolve = lambda path: path if os.path.isabs(path) else os.path.join(baseDir, path)
+    counts = {'success': 0, 'skipped': 0, 'error': 0}
+
+    def renderEntry(lineNumber, entry):
+        start = time.perf_counter()
+        output = resolve(entry['output'])
+        if not force and os.path.exists(output):
+            return {'status': 'skipped', 'output': output}
+        text = entry.get('text')
+        if text is None:
+            with open(resolve(entry['text_file']), 'r', encoding='utf-8') as f:
+                text = f.read()
+        outputDir = os.path.dirname(output)
+        if outputDir:
+            os.makedirs(outputDir, exist_ok=True)
+        createVoiceOver(text, int(entry.get('voice_mode', 0)), bool(entry.get('stupify', False)), maxWorkers, engine, output)
+        if not os.path.exists(output):
+            raise RuntimeError("Audio file was not generated")
+        return {'status': 'success', 'output': output, 'seconds': round(time.perf_counter() - start, 3)}
+
+    with open(manifest, 'r', encoding='utf-8') as lines, open(results, 'a', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        pending = {}
+
+        def record(future):
+            lineNumber, entry = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'status': 'error', 'message': str(e)}
+            result = {'id': entry.get('id', lineNumber), 'line': lineNumber, **result}
+            counts[result['status']] += 1
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+
+        for lineNumber, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                if not isinstance(entry, dict):
+                    raise ValueError("entry must be a JSON object")
+                if 'output' not in entry or ('text' not in entry and 'text_file' not in entry):
+                    raise ValueError("entry needs output and text or text_file")
+            except ValueError as e:
+                counts['error'] += 1
+                out.write(json.dumps({'id': lineNumber, 'line': lineNumber, 'status': 'error', 'message': f"Bad manifest entry: {e}"}) + '\n')
+                continue
+            pending[pool.submit(renderEntry, lineNumber, entry)] = (lineNumber, entry)
+            # Read the manifest only as fast as entries finish
+            if len(pending) >= 2 * max(1, jobs):
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(future)
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                record(future)
+    return counts
 
 def main():
     parser = argparse.ArgumentParser(description='Generate audio from text for NapCast')
-    parser.add_argument('--text-file', required=True, help='Path to text file containing the script')
-    parser.add_argument('--output', required=True, help='Output audio file path')
+    parser.add_argument('--text-file', help='Path to text file containing the script')
+    parser.add_argument('--output', help='Output audio file path')
     parser.add_argument('--voice-mode', type=int, default=0, choices=range(9), help='Voice mode (0-8)')
     parser.add_argument('--filename', default='napcast', help='Base filename for output')
     parser.add_argument('--stupify', action='store_true', help='Apply stupify transformation')
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS, help='Maximum number of chunks synthesized concurrently')
+    parser.add_argument('--engine', default=DEFAULT_ENGINE, choices=sorted(ASSEMBLY_ENGINES), help='Audio assembly engine')
+    parser.add_argument('--serve', action='store_true', help='Run as a daemon with a warm pool of worker processes')
+    parser.add_argument('--socket', default=None, help="Unix socket for --serve, or '-' for stdin/stdout")
+    parser.add_argument('--pool-size', type=int, default=None, help='Worker processes for --serve')
+    parser.add_argument('--daemon-socket', default=os.getenv('NAPCAST_VOICE_SOCKET'), help='Submit the job to a running daemon instead of rendering in this process')
+    parser.add_argument('--batch', help='JSONL manifest of scripts to render in this process')
+    parser.add_argument('--results', help='JSONL file the --batch results are appended to (default: <manifest>.results.jsonl)')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_BATCH_JOBS, help='Episodes rendered concurrently in --batch mode')
+    parser.add_argument('--force', action='store_true', help='Re-render --batch entries whose output already exists')
+    parser.add_argument('--profile', nargs='?', const='', default=None, help='Write a JSON profile of the render (default: <output>.profile.json)')
+    parser.add_argument('--job-id', help='voiceGenerationJobs id recorded in the --profile report')
+    parser.add_argument('--hls', help='Also package the episode as low-bitrate HLS into this directory')
     
     args = parser.parse_args()
+
+    if args.serve:
+        import voice_daemon
+        voice_daemon.serve(args.socket, args.pool_size or voice_daemon.DEFAULT_POOL_SIZE)
+        return
+
+    if args.batch:
+        results = args.results or f"{os.path.splitext(args.batch)[0]}.results.jsonl"
+        counts = runBatch(args.batch, results, args.jobs, args.workers, args.engine, args.force)
+        print(f"Batch finished: {counts['success']} rendered, {counts['skipped']} skipped, {counts['error']} failed. Results in {results}")
+        if counts['error']:
+            sys.exit(1)
+        return
+
+    if not args.text_file or not args.output:
+        parser.error('--text-file and --output are required (or --batch)')
     
     try:
-        # Read text from file
-        with open(args.text_file, 'r', encoding='utf-8') as f:
-            text = f.read()
-        
-        # Generate voice over
-        createVoiceOver(text, args.voice_mode, args.stupify)
+        if args.daemon_socket and os.path.exists(args.daemon_socket):
+            import voice_daemon
+            response = voice_daemon.submitJob({
+                'text_file': os.path.abspath(args.text_file),
+                'output': os.path.abspath(args.output),
+                'voice_mode': args.voice_mode,
+                'stupify': args.stupify,
+                'workers': args.workers,
+                'engine': args.engine,
+                'profile': args.profile is not None,
+                'job_id': args.job_id,
+                'hls': os.path.abspath(args.hls) if args.hls else None,
+            }, args.daemon_socket)
+            if response.get('status') != 'success':
+                raise RuntimeError(response.get('message', 'Voice daemon failed'))
+            if args.hls and response.get('hls') is None:
+                raise RuntimeError("Voice daemon did not package HLS; restart it to pick up --hls support")
+            packaged = response.get('hls')
+            report = response.get('profile')
+        else:
+            # Read text from file
+            with open(args.text_file, 'r', encoding='utf-8') as f:
+                text = f.read()
+            
+            profile = None
+            if args.profile is not None:
+                from render_profile import RenderProfile
+                profile = RenderProfile(jobId=args.job_id, voiceMode=args.voice_mode, textFile=args.text_file, output=args.output)
+
+            # Generate voice over straight into the output location
+            packaged = createVoiceOver(text, args.voice_mode, args.stupify, args.workers, args.engine, args.output, profile, args.hls)
+            report = profile.report() if profile is not None else None
+
+        if packaged is not None:
+            print(f"HLS package written: {os.path.join(args.hls, packaged['playlist'])} ({packaged['bytes']} bytes)")
+
+        if args.profile is not None:
+            if report is None:
+                raise RuntimeError("Voice daemon did not return a profile; restart it to pick up --profile support")
+            profilePath = args.profile or f"{os.path.splitext(args.output)[0]}.profile.json"
+            with open(profilePath, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"Profile written: {profilePath}")
         
-        # Move the generated file to the output location
-        generated_file = 'audio.mp3'
-        if os.path.exists(generated_file):
-            os.rename(generated_file, args.output)
+        if os.path.exists(args.output):
             print(f"Audio generated successfully: {args.output}")
         else:
             print("Error: Audio file was not generated")